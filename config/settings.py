@@ -94,6 +94,8 @@ WSGI_APPLICATION = 'config.wsgi.application'
 USE_POSTGRES = os.getenv('USE_POSTGRES', 'false').lower() in ('1', 'true', 'yes')
 
 if USE_POSTGRES:
+    # Лукапи trigram_similar для нечіткого пошуку міст
+    INSTALLED_APPS.append('django.contrib.postgres')
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.postgresql',
@@ -113,6 +115,50 @@ else:
 }
 
 
+# Кеш
+# За замовчуванням — пам'ять процесу; для кількох воркерів gunicorn
+# задайте REDIS_URL, щоб кеш (стрічка, довідник міст, лічильники) був спільним
+REDIS_URL = os.getenv('REDIS_URL', '')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Брокер подій для SSE-потоків чату
+# LocalBroker працює лише в межах одного процесу; з REDIS_URL події спільні для всіх воркерів
+REALTIME_BROKER = os.getenv(
+    'REALTIME_BROKER',
+    'logistics.realtime.RedisBroker' if REDIS_URL else 'logistics.realtime.LocalBroker'
+)
+
+# Записувати сповіщення у фоновому потоці процесу, а не наприкінці запиту
+NOTIFICATIONS_DEFERRED = os.getenv('NOTIFICATIONS_DEFERRED', 'false').lower() in ('1', 'true', 'yes')
+
+# Скільки днів зберігаємо прочитані сповіщення (команда prune_notifications)
+# Ключ default — для типів без окремого правила; None — не видаляти
+NOTIFICATION_RETENTION_DAYS = {
+    'default': 90,
+    'tracking_updated': 14,
+    'new_message': 30,
+}
+
+# Кількість маршрутів на сторінці списку та в одній порції нескінченного прокручування
+ROUTES_PAGE_SIZE = int(os.getenv('ROUTES_PAGE_SIZE', '30'))
+
+# Скільки опитувань sync_api за 10 секунд вважаємо нормою; вище — клієнти отримують довші інтервали
+POLL_LOAD_THRESHOLD = int(os.getenv('POLL_LOAD_THRESHOLD', '200'))
+
+
 # Валідатори паролів
 # Докладніше: https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
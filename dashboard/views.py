@@ -3,35 +3,26 @@ from django.contrib.auth.decorators import login_required
 from django.core.serializers import serialize
 import json
 from logistics.models import Route
-from logistics.views import check_expired_routes
+from logistics.expiry import check_expired_routes
 
 
 # Головна сторінка з картою та каруселлю останніх маршрутів
 # На карті показуємо всі активні маршрути, у каруселі лише три останні
 def home(request):
     """Home page with dynamic world map"""
-    # Якщо користувач у системі — одразу оновлюємо статус прострочених маршрутів
+    # Якщо користувач у системі — перевіряємо, чи не настав час прострочення (O(1) за кешем)
     if request.user.is_authenticated:
         check_expired_routes()
     
     # Для каруселі беремо 3 найновіші маршрути
     # Використовуємо select_related, щоб мінімізувати кількість запитів
-    # Виключаємо тимчасові маршрути для чату (де origin_city='Чат' або destination_city='Чат')
     routes_carousel = Route.objects.filter(
         status__in=['pending', 'in_transit']
-    ).exclude(
-        origin_city='Чат'
-    ).exclude(
-        destination_city='Чат'
     ).select_related('company', 'carrier').order_by('-created_at')[:3]
     
-    # Для карти потрібні всі активні маршрути (виключаємо чати)
+    # Для карти потрібні всі активні маршрути
     routes_all = Route.objects.filter(
         status__in=['pending', 'in_transit']
-    ).exclude(
-        origin_city='Чат'
-    ).exclude(
-        destination_city='Чат'
     ).select_related('company', 'carrier')
     
     # Формуємо структуру даних для карти та перевіряємо координати
@@ -91,8 +82,7 @@ def statistics(request):
     context = {}
     
     if request.user.role == 'company':
-        # Виключаємо тимчасові маршрути для чату
-        routes = Route.objects.filter(company=request.user).exclude(origin_city='Чат').exclude(destination_city='Чат')
+        routes = Route.objects.filter(company=request.user)
         
         # Статистика по місяцях
         last_6_months = []
@@ -117,9 +107,8 @@ def statistics(request):
             'monthly_data': json.dumps(last_6_months),
         })
     elif request.user.role == 'carrier':
-        bids = Bid.objects.filter(carrier=request.user).exclude(route__origin_city='Чат').exclude(route__destination_city='Чат')
-        # Виключаємо тимчасові маршрути для чату
-        routes = Route.objects.filter(carrier=request.user).exclude(origin_city='Чат').exclude(destination_city='Чат')
+        bids = Bid.objects.filter(carrier=request.user)
+        routes = Route.objects.filter(carrier=request.user)
         
         context.update({
             'total_bids': bids.count(),
@@ -141,13 +130,10 @@ def history(request):
     context = {}
     
     if request.user.role == 'company':
-        # Виключаємо тимчасові маршрути для чату
-        context['routes'] = Route.objects.filter(company=request.user).exclude(origin_city='Чат').exclude(destination_city='Чат').order_by('-created_at')
+        context['routes'] = Route.objects.filter(company=request.user).order_by('-created_at')
         context['all_statuses'] = ['pending', 'in_transit', 'delivered', 'cancelled', 'expired']
     elif request.user.role == 'carrier':
-        # Виключаємо ставки на тимчасові маршрути для чату
-        context['bids'] = Bid.objects.filter(carrier=request.user).exclude(route__origin_city='Чат').exclude(route__destination_city='Чат').select_related('route').order_by('-created_at')
-        # Виключаємо тимчасові маршрути для чату
-        context['my_routes'] = Route.objects.filter(carrier=request.user).exclude(origin_city='Чат').exclude(destination_city='Чат').order_by('-created_at')
+        context['bids'] = Bid.objects.filter(carrier=request.user).select_related('route').order_by('-created_at')
+        context['my_routes'] = Route.objects.filter(carrier=request.user).order_by('-created_at')
     
     return render(request, 'dashboard/history.html', context)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class LogisticsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'logistics'
+
+    def ready(self):
+        # Підключаємо обробники сигналів (push сповіщень)
+        from . import signals  # noqa: F401
@@ -0,0 +1,40 @@
+"""
+Версіоновані записи кешу.
+Запис живе під ключем з номером версії; скидання лише збільшує версію, тож
+перерахунок, що почався до скидання, пише в уже непотрібний ключ і не
+повертає застарілі дані. Старі версії витісняє таймаут запису.
+"""
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+
+
+def cache_is_process_local():
+    """True when the default cache lives in this process and other workers don't see its changes"""
+    return isinstance(caches['default'], LocMemCache)
+
+
+class VersionedKey:
+    """Cache key whose version is bumped to invalidate the entry"""
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.version_key = f'{prefix}:version'
+
+    def current(self):
+        """Key of the entry for the current version"""
+        version = cache.get_or_set(self.version_key, 1, None)
+        return f'{self.prefix}:{version}'
+
+    def bump(self):
+        """Invalidate the entry right away"""
+        try:
+            cache.incr(self.version_key)
+        except ValueError:
+            # Версії немає — наступне читання почне з нового ключа
+            cache.delete(self.version_key)
+
+    def invalidate(self):
+        """Invalidate the entry after the current transaction commits"""
+        transaction.on_commit(self.bump)
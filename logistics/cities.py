@@ -0,0 +1,108 @@
+"""
+Довідник міст відправлення.
+Відсортований список (місто, кількість маршрутів) будується одним GROUP BY
+і живе в кеші (спільному між воркерами з REDIS_URL). Зміни маршрутів скидають
+його через сигнали Route. Дропдаун фільтра та автодоповнення читають лише цей
+список: префікс шукається бінарним пошуком, таблиця маршрутів не переглядається.
+Міста порівнюються за city_search_key («Київ», «КИЇВ» і «Kyiv» — одне місто);
+фільтр маршрутів приймає префікс, а якщо жодне місто з нього не починається —
+схожу назву (одруківки).
+"""
+
+from bisect import bisect_left
+from difflib import get_close_matches
+
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+
+from .caching import VersionedKey
+from .models import Route, city_search_key
+
+
+# Скільки підказок повертає автодоповнення (і стеля для параметра limit)
+CITY_SUGGESTIONS_LIMIT = 10
+
+# Мінімальна схожість назви для нечіткого збігу (difflib, 0..1)
+CITY_FUZZY_CUTOFF = 0.75
+
+# Страховка від пропущеного скидання
+CITY_INDEX_TIMEOUT = 60 * 60
+
+CITY_INDEX_KEY = VersionedKey('logistics:cities')
+
+
+def city_index():
+    """Return (keys, entries): sorted search keys and matching (city, route count) pairs"""
+    key = CITY_INDEX_KEY.current()
+    index = cache.get(key)
+    if index is None:
+        rows = Route.objects.values('origin_city').annotate(routes=Count('pk')).order_by()
+        entries = sorted(((row['origin_city'], row['routes']) for row in rows), key=lambda e: city_search_key(e[0]))
+        index = ([city_search_key(city) for city, _ in entries], entries)
+        cache.set(key, index, CITY_INDEX_TIMEOUT)
+    return index
+
+
+def origin_cities():
+    """All origin cities in alphabetical order"""
+    # Індекс упорядкований за латинськими ключами — для показу сортуємо за назвою
+    return sorted((city for city, _ in city_index()[1]), key=str.casefold)
+
+
+def suggest_cities(prefix, limit=CITY_SUGGESTIONS_LIMIT):
+    """Up to limit (city, route count) pairs whose name starts with prefix"""
+    keys, entries = city_index()
+    prefix = city_search_key(prefix)
+    start = bisect_left(keys, prefix)
+    suggestions = []
+    for position in range(start, min(start + limit, len(keys))):
+        if not keys[position].startswith(prefix):
+            break
+        suggestions.append(entries[position])
+    return sorted(suggestions, key=lambda entry: entry[0].casefold())
+
+
+def similar_city_keys(key):
+    """Keys of known origin cities that look like key, or None if some city starts with key.
+
+    Fuzzy matching (typos, other spellings) is only a fallback for queries that
+    match no city by prefix.
+    """
+    keys = city_index()[0]
+    position = bisect_left(keys, key)
+    if position < len(keys) and keys[position].startswith(key):
+        return None
+    return set(get_close_matches(key, keys, n=CITY_SUGGESTIONS_LIMIT, cutoff=CITY_FUZZY_CUTOFF))
+
+
+def city_matcher(query):
+    """Predicate over origin city keys: prefix of the query key, or a similar known city if none has it"""
+    key = city_search_key(query)
+    similar = similar_city_keys(key)
+    if similar is None:
+        return lambda city_key: city_key.startswith(key)
+    return lambda city_key: city_key in similar
+
+
+def filter_by_origin_city(routes, query):
+    """Filter routes by origin city prefix (or fuzzy match if no city has it) using the indexed search key"""
+    key = city_search_key(query)
+    if not key:
+        return routes
+    similar = similar_city_keys(key)
+    if similar is None:
+        if connection.vendor == 'postgresql':
+            # LIKE 'префікс%' — індекс varchar_pattern_ops
+            return routes.filter(origin_city_key__startswith=key)
+        # Діапазон замість LIKE: регістронезалежний LIKE у SQLite не використовує індекс
+        return routes.filter(origin_city_key__gte=key, origin_city_key__lt=key + chr(0x10FFFF))
+    if connection.vendor == 'postgresql':
+        # % — триграмний GIN-індекс
+        return routes.filter(origin_city_key__trigram_similar=key)
+    return routes.filter(origin_city_key__in=similar)
+
+
+def invalidate_city_index():
+    """Drop the cached city index after the current transaction commits"""
+    CITY_INDEX_KEY.invalidate()
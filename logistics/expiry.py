@@ -0,0 +1,206 @@
+"""
+Фонове прострочення маршрутів.
+Маршрут стає простроченим, якщо до pickup_date не прийнято жодної ставки.
+Запускається командою `python manage.py expire_routes` (разово або в циклі).
+Запити лише звіряють кешовану «найближчу дату забору» з поточним часом
+і запускають прохід, тільки коли щось справді могло прострочитися.
+"""
+
+import threading
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from .feed import invalidate_pending_feed
+from .models import Route, Notification
+from .notifications import write_notifications
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+# Скільки маршрутів оновлюємо за одну транзакцію
+EXPIRY_CHUNK_SIZE = 500
+
+# ID advisory lock (PostgreSQL)
+EXPIRY_LOCK_ID = 0x46434152  # 'FCAR'
+
+# Найближча pickup_date серед маршрутів, що очікують ставок
+# Живе недовго, щоб процеси з локальним кешем швидко бачили чужі зміни
+EXPIRY_WATERMARK_KEY = 'logistics:expire_routes:watermark'
+EXPIRY_WATERMARK_TIMEOUT = 60
+
+# База в пам'яті (тести) існує лише в цьому процесі — досить блокування потоків
+_memory_db_lock = threading.Lock()
+
+
+@contextmanager
+def _file_lock(path):
+    """Try to take an exclusive OS lock on path, yields True on success.
+
+    The OS drops the lock when the process exits, so a crashed worker never
+    leaves it behind.
+    """
+    with open(path, 'a+b') as lock_file:
+        try:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+# Міжпроцесне блокування: лише один воркер одночасно проставляє expired.
+# Кеш для цього не годиться — LocMemCache (без REDIS_URL) у кожного процесу свій
+@contextmanager
+def expiry_lock():
+    """Try to acquire cross-process expiry lock, yields True on success"""
+    if connection.vendor == 'postgresql':
+        # Advisory lock тримається на рівні сесії PostgreSQL
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_try_advisory_lock(%s)', [EXPIRY_LOCK_ID])
+            acquired = cursor.fetchone()[0]
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT pg_advisory_unlock(%s)', [EXPIRY_LOCK_ID])
+    elif connection.is_in_memory_db():
+        acquired = _memory_db_lock.acquire(blocking=False)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                _memory_db_lock.release()
+    else:
+        # Файл SQLite спільний для всіх процесів на цій машині — поруч із ним і файл блокування
+        with _file_lock(f"{connection.settings_dict['NAME']}.expire_routes.lock") as acquired:
+            yield acquired
+
+
+# Маршрути, що ще чекають на ставку (кандидати на прострочення)
+def _pending_routes_queryset():
+    return Route.objects.filter(
+        status='pending',
+        carrier__isnull=True
+    )
+
+
+# Набір маршрутів, що мали бути прийняті до поточного моменту
+def _expired_routes_queryset(now):
+    return _pending_routes_queryset().filter(pickup_date__lt=now)
+
+
+def refresh_expiry_watermark():
+    """Recalculate the earliest pending pickup_date and store it in cache"""
+    watermark = _pending_routes_queryset().aggregate(Min('pickup_date'))['pickup_date__min']
+    # False означає «немає маршрутів, що очікують» (None кеш повертає для відсутнього ключа)
+    cache.set(EXPIRY_WATERMARK_KEY, watermark or False, EXPIRY_WATERMARK_TIMEOUT)
+    return watermark
+
+
+def get_expiry_watermark():
+    """Return the earliest pending pickup_date (None when nothing is pending)"""
+    watermark = cache.get(EXPIRY_WATERMARK_KEY)
+    if watermark is None:
+        return refresh_expiry_watermark()
+    return watermark or None
+
+
+# Новий або відредагований маршрут може мати ранішу дату забору
+def lower_expiry_watermark(pickup_date):
+    """Move the cached watermark down to pickup_date if it is earlier"""
+    watermark = cache.get(EXPIRY_WATERMARK_KEY)
+    if watermark is None:
+        # Ключа немає — наступна перевірка перерахує його з бази
+        return
+    if watermark is False or pickup_date < watermark:
+        cache.set(EXPIRY_WATERMARK_KEY, pickup_date, EXPIRY_WATERMARK_TIMEOUT)
+
+
+# Маршрут більше не очікує ставок (прийнято ставку)
+def discard_expiry_deadline(pickup_date):
+    """Drop the cached watermark if it was set by this pickup_date"""
+    watermark = cache.get(EXPIRY_WATERMARK_KEY)
+    if watermark and watermark >= pickup_date:
+        cache.delete(EXPIRY_WATERMARK_KEY)
+
+
+# Одна порція: UPDATE статусу та сповіщення компаніям в одній транзакції
+def _expire_chunk(now, chunk_size):
+    with transaction.atomic():
+        rows = list(
+            _expired_routes_queryset(now)
+            .select_for_update()
+            .order_by('pk')
+            .values('pk', 'company_id')[:chunk_size]
+        )
+        if not rows:
+            return 0
+
+        route_ids = [row['pk'] for row in rows]
+        # update() не викликає save(), тому updated_at виставляємо вручну
+        Route.objects.filter(pk__in=route_ids).update(status='expired', updated_at=now)
+        # update() обходить сигнали — стрічку перевізників скидаємо явно
+        invalidate_pending_feed()
+
+        notifications = []
+        for row in rows:
+            notifications.append(Notification(
+                user_id=row['company_id'],
+                notification_type='route_expired',
+                route_id=row['pk']
+            ))
+        # Дублікати відсікає унікальне обмеження unique_route_expired_notification;
+        # пишемо в цій же транзакції, що й статус маршрутів
+        write_notifications(notifications, ignore_conflicts=True)
+    return len(rows)
+
+
+def expire_routes(now=None, chunk_size=EXPIRY_CHUNK_SIZE):
+    """Mark overdue pending routes as expired in bounded chunks.
+
+    Returns the number of expired routes, or None if another worker holds the lock.
+    """
+    now = now or timezone.now()
+    with expiry_lock() as acquired:
+        if not acquired:
+            return None
+
+        expired_count = 0
+        while True:
+            count = _expire_chunk(now, chunk_size)
+            expired_count += count
+            # Неповна порція означає, що прострочених більше немає
+            if count < chunk_size:
+                break
+        refresh_expiry_watermark()
+        return expired_count
+
+
+# Дешева перевірка для запитів: O(1) доступ до кешу в більшості випадків
+def check_expired_routes(now=None):
+    """Expire routes only if the cached watermark says some are overdue"""
+    now = now or timezone.now()
+    watermark = get_expiry_watermark()
+    if watermark is None or watermark >= now:
+        return 0
+    return expire_routes(now=now) or 0
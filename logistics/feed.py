@@ -0,0 +1,146 @@
+"""
+Стрічка маршрутів.
+Рядки стрічки — компактні словники з полями для показу (без моделей), тож їх
+можна класти в кеш. Стрічка перевізників однакова для всіх, тому pending-маршрути
+вибираються одним запитом у спільний запис кешу (спільний між воркерами з REDIS_URL),
+а фільтри й курсор кожного запиту застосовуються в пам'яті.
+Будь-яка зміна маршруту скидає запис: сигнали Route і явні виклики після update().
+Скидання бачать усі процеси лише зі спільним кешем (REDIS_URL); з кешем процесу
+статуси маршрутів сторінки звіряються з базою одним запитом.
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .caching import VersionedKey, cache_is_process_local
+from .cities import city_matcher
+from .models import Route
+
+
+# Поля стрічки: компанія, перевізник і його рейтинг беремо JOIN-ами
+ROUTE_FIELDS = (
+    'id', 'origin_city', 'origin_city_key', 'destination_city', 'cargo_type', 'weight', 'price',
+    'status', 'pickup_date', 'delivery_date', 'created_at', 'company_id', 'company__company_name',
+    'company__username', 'carrier_id', 'carrier__username', 'carrier__carrier_profile__rating',
+)
+
+STATUS_LABELS = dict(Route.STATUS_CHOICES)
+
+# Страховка від пропущеного скидання (наприклад, зміни назви компанії)
+PENDING_FEED_TIMEOUT = 5 * 60
+
+PENDING_FEED_KEY = VersionedKey('logistics:feed:pending')
+
+
+def route_rows(routes):
+    """Yield compact display rows for a routes queryset, read with one query"""
+    for row in routes.values(*ROUTE_FIELDS).iterator():
+        rating = row['carrier__carrier_profile__rating']
+        yield {
+            'id': row['id'],
+            'origin_city': row['origin_city'],
+            'origin_city_key': row['origin_city_key'],
+            'destination_city': row['destination_city'],
+            'cargo_type': row['cargo_type'],
+            'weight': row['weight'],
+            'price': row['price'],
+            'status': row['status'],
+            'status_display': STATUS_LABELS.get(row['status'], row['status']),
+            'pickup_date': row['pickup_date'],
+            'delivery_date': row['delivery_date'],
+            'created_at': row['created_at'],
+            'company_id': row['company_id'],
+            'company_name': row['company__company_name'] or row['company__username'],
+            'carrier_id': row['carrier_id'],
+            'carrier_name': row['carrier__username'],
+            'carrier_rating': float(rating) if rating else None,
+        }
+
+
+def route_json(row):
+    """JSON-ready copy of a feed row: decimals as strings, dates in ISO 8601"""
+    route_data = {
+        'id': row['id'],
+        'origin_city': row['origin_city'],
+        'destination_city': row['destination_city'],
+        'cargo_type': row['cargo_type'],
+        'weight': str(row['weight']),  # у JSON відправляємо рядком
+        'price': str(row['price']),    # аналогічно для ціни
+        'status': row['status'],
+        'status_display': row['status_display'],
+        'pickup_date': row['pickup_date'].isoformat() if row['pickup_date'] else None,
+        'delivery_date': row['delivery_date'].isoformat() if row['delivery_date'] else None,
+        'company_id': row['company_id'],
+        'company_name': row['company_name'],
+    }
+    # Якщо є призначений перевізник — додаємо його дані
+    if row['carrier_id']:
+        route_data['carrier_id'] = row['carrier_id']
+        route_data['carrier_name'] = row['carrier_name']
+        if row['carrier_rating']:
+            route_data['carrier_rating'] = row['carrier_rating']
+    return route_data
+
+
+def pending_feed():
+    """All pending routes as feed rows, newest first, shared by every carrier"""
+    key = PENDING_FEED_KEY.current()
+    rows = cache.get(key)
+    if rows is None:
+        rows = list(route_rows(Route.objects.filter(status='pending').order_by('-created_at', '-pk')))
+        cache.set(key, rows, PENDING_FEED_TIMEOUT)
+    return rows
+
+
+def invalidate_pending_feed():
+    """Drop the shared pending feed after the current transaction commits"""
+    PENDING_FEED_KEY.invalidate()
+
+
+def _page(rows, matches_city, cursor):
+    page = []
+    for row in rows:
+        if cursor and (row['created_at'], row['id']) >= cursor:
+            continue
+        if matches_city and not matches_city(row['origin_city_key']):
+            continue
+        page.append(row)
+        if len(page) > settings.ROUTES_PAGE_SIZE:
+            break
+    return page
+
+
+def _has_stale_rows(page):
+    ids = [row['id'] for row in page]
+    return Route.objects.filter(pk__in=ids, status='pending').count() != len(ids)
+
+
+def pending_routes(city='', statuses=(), before_id=None, before_time=None):
+    """One page of the pending feed plus a has-more row, filtered in memory"""
+    rows = pending_feed()
+    if statuses and 'pending' not in statuses:
+        return []
+    matches_city = city_matcher(city) if city else None
+    cursor = None
+    if before_id and before_time:
+        # Повний курсор від клієнта не залежить від того, чи маршрут ще існує
+        cursor = (before_time, before_id)
+    elif before_id:
+        # Старі посилання без часу: шукаємо маршрут курсора
+        cursor = next((
+            (row['created_at'], row['id']) for row in rows if row['id'] == before_id
+        ), None)
+        if cursor is None:
+            # Маршрут з курсора вже покинув стрічку — беремо його час з бази
+            created_at = Route.objects.filter(pk=before_id).values_list('created_at', flat=True).first()
+            if created_at is None:
+                return []
+            cursor = (created_at, before_id)
+
+    page = _page(rows, matches_city, cursor)
+    if page and cache_is_process_local() and _has_stale_rows(page):
+        # Кеш процесу не бачить скидань з інших процесів (воркер прострочення, інші
+        # воркери gunicorn) — звіряємо статуси сторінки і за потреби перечитуємо стрічку
+        PENDING_FEED_KEY.bump()
+        page = _page(pending_feed(), matches_city, cursor)
+    return page
@@ -0,0 +1,142 @@
+"""
+Лічильники непрочитаних повідомлень по учасниках розмови.
+Нові повідомлення створюємо й позначаємо прочитаними через ці функції,
+щоб ConversationParticipant завжди відповідав таблиці повідомлень,
+а бейджі та вхідні читали готові значення замість підрахунку Message.
+Стан прочитання — водяний знак last_read_id учасника: повідомлення з більшим id
+непрочитане, тож позначка «прочитано» змінює один рядок, а не таблицю Message.
+Сповіщення new_message згортаються: одне непрочитане на розмову з лічильником.
+"""
+
+from django.db import transaction
+from django.db.models import BigIntegerField, Case, Exists, F, OuterRef, PositiveIntegerField, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import ConversationParticipant, Message
+from .notifications import notify
+
+
+# Скільки повідомлень показуємо при відкритті чату та догружаємо за раз
+MESSAGES_PAGE_SIZE = 50
+
+
+def create_message(conversation, sender, recipient, content):
+    """Save a message and update both participants' counters atomically"""
+    with transaction.atomic():
+        message = Message.objects.create(
+            conversation=conversation,
+            sender=sender,
+            recipient=recipient,
+            content=content
+        )
+        # Рядки учасників з'являються з першим повідомленням розмови
+        ConversationParticipant.objects.bulk_create(
+            [ConversationParticipant(conversation=conversation, user_id=user_id)
+             for user_id in (sender.pk, recipient.pk)],
+            ignore_conflicts=True
+        )
+        # Один UPDATE на обидва рядки; паралельне повідомлення з більшим id не перезаписуємо
+        ConversationParticipant.objects.filter(conversation=conversation).update(
+            unread_count=Case(
+                When(user_id=recipient.pk, then=F('unread_count') + 1),
+                default=F('unread_count'),
+                output_field=PositiveIntegerField(),
+            ),
+            last_message_id=Case(
+                When(last_message_id__gt=message.pk, then=F('last_message_id')),
+                default=Value(message.pk),
+                output_field=BigIntegerField(),
+            ),
+        )
+    return message
+
+
+def mark_read(conversation_id, user_id, message_id=None):
+    """Move the participant's read watermark up to message_id (None — the last message).
+
+    Returns how many messages became read (0 if the watermark was already there).
+    """
+    with transaction.atomic():
+        # Блокуємо рядок, щоб паралельне create_message не загубило інкремент
+        state = (
+            ConversationParticipant.objects.select_for_update()
+            .filter(conversation_id=conversation_id, user_id=user_id)
+            .first()
+        )
+        if state is None:
+            return 0
+        if message_id is None:
+            message_id = state.last_message_id or 0
+        if state.last_read_id >= message_id:
+            return 0
+        # Зазвичай читають до останнього повідомлення — тоді рахувати нічого
+        if state.last_message_id is None or message_id >= state.last_message_id:
+            remaining = 0
+        else:
+            remaining = Message.objects.filter(
+                conversation_id=conversation_id, recipient_id=user_id, pk__gt=message_id
+            ).count()
+        read_count = max(state.unread_count - remaining, 0)
+        state.last_read_id = message_id
+        state.unread_count = remaining
+        state.save(update_fields=['last_read_id', 'unread_count'])
+    return read_count
+
+
+# is_read для галочок відправника: чи дійшов водяний знак отримувача до повідомлення
+def with_read_state(queryset):
+    """Annotate messages with is_read computed from the recipient's watermark"""
+    return queryset.annotate(is_read=Exists(
+        ConversationParticipant.objects.filter(
+            conversation_id=OuterRef('conversation_id'),
+            user_id=OuterRef('recipient_id'),
+            last_read_id__gte=OuterRef('pk'),
+        )
+    ))
+
+
+def total_unread_messages(user):
+    """Unread messages across all of the user's conversations"""
+    return ConversationParticipant.objects.filter(user=user).aggregate(
+        total=Coalesce(Sum('unread_count'), 0, output_field=PositiveIntegerField())
+    )['total']
+
+
+# Історія сторінками з кінця: keyset по (created_at, id), тож вартість не залежить від довжини чату
+def message_history(conversation, before_id=None, limit=None):
+    """Return (messages oldest first, has_older) for the page ending before before_id"""
+    limit = limit or MESSAGES_PAGE_SIZE
+    queryset = Message.objects.filter(conversation=conversation)
+    if before_id:
+        # Час курсора підставляємо підзапитом — без окремого звернення до бази
+        cursor_time = Subquery(
+            Message.objects.filter(pk=before_id, conversation=conversation).values('created_at')[:1]
+        )
+        queryset = queryset.filter(
+            Q(created_at__lt=cursor_time) | Q(created_at=cursor_time, pk__lt=before_id)
+        )
+    page = list(
+        with_read_state(queryset)
+        .select_related('sender')
+        .order_by('-created_at', '-pk')[:limit + 1]
+    )
+    # Зайвий рядок лише сигналізує, що є старіші повідомлення
+    has_older = len(page) > limit
+    page = page[:limit]
+    page.reverse()
+    return page, has_older
+
+
+def notify_new_message(message):
+    """Notify the recipient about a message through the notification service.
+
+    new_message is coalesced by the service: one unread notification per
+    conversation whose counter and preview follow the latest message.
+    """
+    return notify(
+        user=message.recipient,
+        notification_type='new_message',
+        conversation=message.conversation,
+        sender=message.sender.username,
+        preview=message.content[:50],
+    )
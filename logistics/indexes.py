@@ -0,0 +1,33 @@
+"""
+Індекси, специфічні для PostgreSQL.
+Модуль імпортують міграції, тож змінювати класи можна лише сумісно з ними.
+"""
+
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db.backends.ddl_references import Statement
+
+
+class TrigramIndex(GinIndex):
+    """GIN index with gin_trgm_ops for the % similarity operator (pg_trgm).
+
+    The index is part of the model state on every database, but only PostgreSQL
+    creates it: other backends have no trigram search and get a no-op statement.
+    """
+
+    def __init__(self, field_name, *, name):
+        self.field_name = field_name
+        super().__init__(OpClass(field_name, name='gin_trgm_ops'), name=name)
+
+    def deconstruct(self):
+        path, _, _ = super().deconstruct()
+        return path, (self.field_name,), {'name': self.name}
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor != 'postgresql':
+            return Statement('-- %(name)s: PostgreSQL only', name=self.name)
+        return super().create_sql(model, schema_editor, using=using, **kwargs)
+
+    def remove_sql(self, model, schema_editor, **kwargs):
+        if schema_editor.connection.vendor != 'postgresql':
+            return Statement('-- %(name)s: PostgreSQL only', name=self.name)
+        return super().remove_sql(model, schema_editor, **kwargs)
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from logistics.expiry import EXPIRY_CHUNK_SIZE, expire_routes
+
+
+# Воркер прострочення маршрутів
+# Разовий запуск — для cron/systemd timer, --loop — як окремий процес-планувальник
+class Command(BaseCommand):
+    help = 'Позначає прострочені маршрути (pending без перевізника після pickup_date)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Працювати безперервно з паузою --interval між проходами',
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=60,
+            help='Пауза між проходами в секундах (для --loop)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=EXPIRY_CHUNK_SIZE,
+            help='Кількість маршрутів в одній транзакції',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            expired_count = expire_routes(chunk_size=options['chunk_size'])
+            if expired_count is None:
+                self.stdout.write('Інший воркер уже обробляє прострочені маршрути')
+            elif expired_count:
+                self.stdout.write(self.style.SUCCESS(f'Прострочено маршрутів: {expired_count}'))
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
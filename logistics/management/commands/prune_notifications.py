@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from logistics.retention import PRUNE_CHUNK_SIZE, prune_notifications
+
+
+# Очищення старих прочитаних сповіщень за NOTIFICATION_RETENTION_DAYS
+# Разовий запуск — для cron/systemd timer, --loop — як окремий процес
+class Command(BaseCommand):
+    help = 'Видаляє (або архівує) прочитані сповіщення, старші за строк зберігання'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--archive',
+            metavar='FILE',
+            help='Перед видаленням дописати сповіщення у файл JSON Lines',
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Працювати безперервно з паузою --interval між проходами',
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=60 * 60,
+            help='Пауза між проходами в секундах (для --loop)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=PRUNE_CHUNK_SIZE,
+            help='Кількість сповіщень в одній транзакції',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            if options['archive']:
+                with open(options['archive'], 'a', encoding='utf-8') as archive:
+                    deleted = prune_notifications(chunk_size=options['chunk_size'], archive=archive)
+            else:
+                deleted = prune_notifications(chunk_size=options['chunk_size'])
+            for notification_type, count in deleted.items():
+                self.stdout.write(self.style.SUCCESS(f'Видалено сповіщень {notification_type}: {count}'))
+
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
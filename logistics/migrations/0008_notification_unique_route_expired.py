@@ -0,0 +1,33 @@
+# Згенеровано Django 4.2.7 2026-10-16 23:12
+
+from django.db import migrations, models
+
+
+# Перед додаванням обмеження прибираємо дублікати route_expired (лишаємо найстаріше)
+def remove_duplicate_expired_notifications(apps, schema_editor):
+    Notification = apps.get_model('logistics', 'Notification')
+    seen = set()
+    duplicate_ids = []
+    expired = Notification.objects.filter(notification_type='route_expired').order_by('pk')
+    for pk, user_id, route_id in expired.values_list('pk', 'user_id', 'route_id'):
+        key = (user_id, route_id)
+        if key in seen:
+            duplicate_ids.append(pk)
+        else:
+            seen.add(key)
+    Notification.objects.filter(pk__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0007_alter_notification_notification_type_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_expired_notifications, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(condition=models.Q(('notification_type', 'route_expired')), fields=('user', 'notification_type', 'route'), name='unique_route_expired_notification'),
+        ),
+    ]
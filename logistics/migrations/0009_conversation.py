@@ -0,0 +1,46 @@
+# Згенеровано Django 4.2.7 2026-10-16 23:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('logistics', '0008_notification_unique_route_expired'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Створено')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Оновлено')),
+                ('carrier', models.ForeignKey(limit_choices_to={'role': 'carrier'}, on_delete=django.db.models.deletion.CASCADE, related_name='carrier_conversations', to=settings.AUTH_USER_MODEL, verbose_name='Перевізник')),
+                ('company', models.ForeignKey(limit_choices_to={'role': 'company'}, on_delete=django.db.models.deletion.CASCADE, related_name='company_conversations', to=settings.AUTH_USER_MODEL, verbose_name='Компанія')),
+                ('route', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='conversation', to='logistics.route', verbose_name='Маршрут')),
+            ],
+            options={
+                'verbose_name': 'Розмова',
+                'verbose_name_plural': 'Розмови',
+                'ordering': ['-updated_at'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.UniqueConstraint(condition=models.Q(('route__isnull', True)), fields=('company', 'carrier'), name='unique_direct_conversation'),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='conversation',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='logistics.conversation', verbose_name='Розмова'),
+        ),
+        migrations.AddField(
+            model_name='notification',
+            name='conversation',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='logistics.conversation', verbose_name='Розмова'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Згенеровано Django 4.2.7 2026-10-16 23:30
+
+from django.db import migrations
+from django.db.models import Q
+
+
+# Тимчасові маршрути з origin_city='Чат' перетворюємо на прямі розмови,
+# а повідомлення справжніх маршрутів — на розмови, прив'язані до маршруту.
+# Самі тимчасові маршрути видаляє 0012 — після того, як Message.route зникне
+def move_messages_to_conversations(apps, schema_editor):
+    Route = apps.get_model('logistics', 'Route')
+    Message = apps.get_model('logistics', 'Message')
+    Notification = apps.get_model('logistics', 'Notification')
+    Conversation = apps.get_model('logistics', 'Conversation')
+
+    chat_routes = Route.objects.filter(Q(origin_city='Чат') | Q(destination_city='Чат'))
+    for route in chat_routes:
+        if route.carrier_id:
+            # Кілька тимчасових маршрутів між парою зливаємо в одну розмову
+            conversation, _ = Conversation.objects.get_or_create(
+                company_id=route.company_id,
+                carrier_id=route.carrier_id,
+                route=None,
+            )
+            Message.objects.filter(route=route).update(conversation=conversation)
+            Notification.objects.filter(route=route).update(conversation=conversation, route=None)
+
+    route_ids = Message.objects.filter(conversation__isnull=True).values_list('route_id', flat=True).distinct()
+    for route in Route.objects.filter(pk__in=list(route_ids)):
+        # Маршрут без перевізника — беремо учасника з першого повідомлення
+        carrier_id = route.carrier_id
+        if not carrier_id:
+            first_message = Message.objects.filter(route=route).order_by('created_at').first()
+            carrier_id = first_message.recipient_id if first_message.sender_id == route.company_id else first_message.sender_id
+        conversation = Conversation.objects.create(
+            company_id=route.company_id,
+            carrier_id=carrier_id,
+            route=route,
+        )
+        Message.objects.filter(route=route).update(conversation=conversation)
+        Notification.objects.filter(route=route, notification_type='new_message').update(conversation=conversation)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0009_conversation'),
+    ]
+
+    operations = [
+        migrations.RunPython(move_messages_to_conversations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Згенеровано Django 4.2.7 2026-10-16 23:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0010_move_chat_routes_to_conversations'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='message',
+            name='route',
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='conversation',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='messages', to='logistics.conversation', verbose_name='Розмова'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Згенеровано Django 4.2.7 2026-10-16 23:30
+
+from django.db import migrations
+from django.db.models import Q
+
+
+# Повідомлення вже перенесені в розмови (0010) — тимчасові маршрути більше не потрібні
+def delete_chat_routes(apps, schema_editor):
+    Route = apps.get_model('logistics', 'Route')
+    Route.objects.filter(Q(origin_city='Чат') | Q(destination_city='Чат')).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0011_remove_message_route'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_chat_routes, migrations.RunPython.noop),
+    ]
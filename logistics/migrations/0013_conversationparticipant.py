@@ -0,0 +1,65 @@
+# Згенеровано Django 4.2.7 2026-10-16 23:27
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Заповнюємо лічильники для наявних розмов з таблиці повідомлень
+def fill_participants(apps, schema_editor):
+    Conversation = apps.get_model('logistics', 'Conversation')
+    Message = apps.get_model('logistics', 'Message')
+    ConversationParticipant = apps.get_model('logistics', 'ConversationParticipant')
+
+    unread = {
+        (row['conversation_id'], row['recipient_id']): row['count']
+        for row in Message.objects.filter(is_read=False)
+        .values('conversation_id', 'recipient_id')
+        .annotate(count=models.Count('pk'))
+    }
+    last_messages = dict(
+        Message.objects.values('conversation_id')
+        .annotate(last_id=models.Max('pk'))
+        .values_list('conversation_id', 'last_id')
+    )
+
+    participants = []
+    for conversation_id, company_id, carrier_id in Conversation.objects.values_list('pk', 'company_id', 'carrier_id'):
+        for user_id in (company_id, carrier_id):
+            participants.append(ConversationParticipant(
+                conversation_id=conversation_id,
+                user_id=user_id,
+                unread_count=unread.get((conversation_id, user_id), 0),
+                last_message_id=last_messages.get(conversation_id),
+            ))
+    ConversationParticipant.objects.bulk_create(participants, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('logistics', '0012_delete_chat_routes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationParticipant',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unread_count', models.PositiveIntegerField(default=0, verbose_name='Непрочитані')),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='participants', to='logistics.conversation', verbose_name='Розмова')),
+                ('last_message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='logistics.message', verbose_name='Останнє повідомлення')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversation_states', to=settings.AUTH_USER_MODEL, verbose_name='Учасник')),
+            ],
+            options={
+                'verbose_name': 'Учасник розмови',
+                'verbose_name_plural': 'Учасники розмов',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='conversationparticipant',
+            constraint=models.UniqueConstraint(fields=('conversation', 'user'), name='unique_conversation_participant'),
+        ),
+        migrations.RunPython(fill_participants, migrations.RunPython.noop),
+    ]
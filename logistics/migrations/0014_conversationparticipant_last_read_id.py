@@ -0,0 +1,45 @@
+# Згенеровано Django 4.2.7 2026-10-16 23:48
+
+from django.db import migrations, models
+
+
+# Переносимо стан прочитання з Message.is_read у водяні знаки учасників:
+# знак стоїть перед першим непрочитаним вхідним повідомленням (або на останньому вхідному)
+def fill_read_watermarks(apps, schema_editor):
+    Message = apps.get_model('logistics', 'Message')
+    ConversationParticipant = apps.get_model('logistics', 'ConversationParticipant')
+
+    incoming = Message.objects.values('conversation_id', 'recipient_id')
+    first_unread = {
+        (row['conversation_id'], row['recipient_id']): row['first_id']
+        for row in incoming.filter(is_read=False).annotate(first_id=models.Min('pk'))
+    }
+    last_incoming = {
+        (row['conversation_id'], row['recipient_id']): row['last_id']
+        for row in incoming.annotate(last_id=models.Max('pk'))
+    }
+
+    participants = list(ConversationParticipant.objects.all())
+    for participant in participants:
+        key = (participant.conversation_id, participant.user_id)
+        if key in first_unread:
+            participant.last_read_id = first_unread[key] - 1
+        else:
+            participant.last_read_id = last_incoming.get(key, 0)
+    ConversationParticipant.objects.bulk_update(participants, ['last_read_id'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0013_conversationparticipant'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversationparticipant',
+            name='last_read_id',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Прочитано до повідомлення'),
+        ),
+        migrations.RunPython(fill_read_watermarks, migrations.RunPython.noop),
+    ]
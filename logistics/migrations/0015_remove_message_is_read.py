@@ -0,0 +1,17 @@
+# Згенеровано Django 4.2.7 2026-10-16 23:48
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0014_conversationparticipant_last_read_id'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='message',
+            name='is_read',
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Згенеровано Django 4.2.7 2026-10-16 23:36
+
+from django.db import migrations, models
+
+
+# Згортаємо наявні непрочитані new_message: лишаємо найновіше сповіщення розмови з лічильником
+def collapse_message_notifications(apps, schema_editor):
+    Notification = apps.get_model('logistics', 'Notification')
+
+    unread = Notification.objects.filter(
+        notification_type='new_message', is_read=False, conversation__isnull=False
+    )
+    groups = (
+        unread.values('user_id', 'conversation_id')
+        .annotate(total=models.Count('pk'), latest_id=models.Max('pk'))
+        .filter(total__gt=1)
+    )
+    for group in groups:
+        Notification.objects.filter(pk=group['latest_id']).update(
+            count=group['total'], title=f"Нові повідомлення: {group['total']}"
+        )
+        unread.filter(
+            user_id=group['user_id'], conversation_id=group['conversation_id']
+        ).exclude(pk=group['latest_id']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0016_message_history_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='count',
+            field=models.PositiveIntegerField(default=1, verbose_name='Кількість'),
+        ),
+        migrations.RunPython(collapse_message_notifications, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='notification',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_read', False), ('notification_type', 'new_message')), fields=('user', 'conversation'), name='unique_unread_message_notification'),
+        ),
+    ]
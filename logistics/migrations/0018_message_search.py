@@ -0,0 +1,71 @@
+# Згенеровано Django 4.2.7 2026-10-16 23:55
+
+from django.db import migrations
+
+
+# SQLite: FTS5 поверх logistics_message (external content) і тригери, що тримають індекс актуальним
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE logistics_message_fts USING fts5(
+        content, content='logistics_message', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER logistics_message_fts_insert AFTER INSERT ON logistics_message BEGIN
+        INSERT INTO logistics_message_fts(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER logistics_message_fts_delete AFTER DELETE ON logistics_message BEGIN
+        INSERT INTO logistics_message_fts(logistics_message_fts, rowid, content)
+        VALUES ('delete', old.id, old.content);
+    END
+    """,
+    """
+    CREATE TRIGGER logistics_message_fts_update AFTER UPDATE OF content ON logistics_message BEGIN
+        INSERT INTO logistics_message_fts(logistics_message_fts, rowid, content)
+        VALUES ('delete', old.id, old.content);
+        INSERT INTO logistics_message_fts(rowid, content) VALUES (new.id, new.content);
+    END
+    """,
+    # Індексуємо вже наявні повідомлення
+    "INSERT INTO logistics_message_fts(logistics_message_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS logistics_message_fts_update',
+    'DROP TRIGGER IF EXISTS logistics_message_fts_delete',
+    'DROP TRIGGER IF EXISTS logistics_message_fts_insert',
+    'DROP TABLE IF EXISTS logistics_message_fts',
+]
+
+# PostgreSQL: індекс за виразом оновлюється разом із рядком, тригери не потрібні
+POSTGRES_FORWARD = [
+    "CREATE INDEX message_content_fts_idx ON logistics_message USING GIN (to_tsvector('simple', content))",
+]
+
+POSTGRES_BACKWARD = [
+    'DROP INDEX IF EXISTS message_content_fts_idx',
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0017_notification_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}),
+            _run({'sqlite': SQLITE_BACKWARD, 'postgresql': POSTGRES_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,94 @@
+# Згенеровано Django 4.2.7 2026-10-17 00:05
+
+import unicodedata
+
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+import logistics.indexes
+
+
+# Знімок logistics.models.city_search_key на момент міграції: дані міграції
+# не повинні змінюватися разом із моделлю. Нова версія функції — нова міграція
+_TRANSLIT = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'h', 'ґ': 'g', 'д': 'd', 'е': 'e', 'є': 'ie',
+    'ж': 'zh', 'з': 'z', 'и': 'y', 'і': 'i', 'ї': 'i', 'й': 'i', 'к': 'k', 'л': 'l',
+    'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
+    'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'shch', 'ь': '',
+    'ю': 'iu', 'я': 'ia', 'ы': 'y', 'э': 'e', 'ё': 'e', 'ъ': '',
+}
+_TRANSLIT_INITIAL = {'є': 'ye', 'ї': 'yi', 'й': 'y', 'ю': 'yu', 'я': 'ya'}
+
+
+def city_search_key(city):
+    text = unicodedata.normalize('NFC', city.casefold()).replace('зг', 'зґг')
+    latin = []
+    word_start = True
+    for char in text:
+        if word_start and char in _TRANSLIT_INITIAL:
+            latin.append(_TRANSLIT_INITIAL[char])
+        else:
+            latin.append(_TRANSLIT.get(char, char))
+        word_start = not char.isalnum() and char not in "'’ʼ"
+    text = unicodedata.normalize('NFKD', ''.join(latin))
+    return ''.join(char for char in text if char.isalnum())[:255]
+
+
+def fill_city_keys(apps, schema_editor):
+    Route = apps.get_model('logistics', 'Route')
+    routes = Route.objects.only('origin_city', 'destination_city').order_by('pk')
+    batch = []
+    for route in routes.iterator(chunk_size=1000):
+        route.origin_city_key = city_search_key(route.origin_city)
+        route.destination_city_key = city_search_key(route.destination_city)
+        batch.append(route)
+        if len(batch) == 1000:
+            Route.objects.bulk_update(batch, ['origin_city_key', 'destination_city_key'])
+            batch = []
+    Route.objects.bulk_update(batch, ['origin_city_key', 'destination_city_key'])
+
+
+# Django 4.2 перевіряє СУБД лише при застосуванні розширення, а не при відкаті
+class TrigramExtensionOnPostgres(TrigramExtension):
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0020_notification_params'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='route',
+            name='destination_city_key',
+            field=models.CharField(default='', editable=False, max_length=255, verbose_name='Ключ міста призначення'),
+        ),
+        migrations.AddField(
+            model_name='route',
+            name='origin_city_key',
+            field=models.CharField(default='', editable=False, max_length=255, verbose_name='Ключ міста відправлення'),
+        ),
+        migrations.RunPython(fill_city_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='route',
+            index=models.Index(fields=['origin_city_key'], name='route_origin_city_key_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='route',
+            index=models.Index(fields=['destination_city_key'], name='route_dest_city_key_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        # PostgreSQL: триграмні індекси для нечіткого пошуку (оператор %); інші бази їх пропускають
+        TrigramExtensionOnPostgres(),
+        migrations.AddIndex(
+            model_name='route',
+            index=logistics.indexes.TrigramIndex('origin_city_key', name='route_origin_city_trgm_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='route',
+            index=logistics.indexes.TrigramIndex('destination_city_key', name='route_dest_city_trgm_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Згенеровано Django 4.2.7 2026-10-17 00:47
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('logistics', '0021_route_city_keys'),
+    ]
+
+    operations = [
+        # Фільтра за містом призначення немає — індекси лише сповільнювали запис
+        migrations.RemoveIndex(
+            model_name='route',
+            name='route_dest_city_key_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='route',
+            name='route_dest_city_trgm_idx',
+        ),
+    ]
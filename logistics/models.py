@@ -1,7 +1,58 @@
+import unicodedata
+from functools import lru_cache
+from string import Formatter
+
 from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
+from django.utils import timezone
 from accounts.models import User
 
+from .indexes import TrigramIndex
+
+
+# Шаблон розбираємо один раз: далі рендеринг лише склеює готові частини
+@lru_cache(maxsize=None)
+def _parse_template(template):
+    return tuple((literal, field) for literal, field, _, _ in Formatter().parse(template))
+
+
+def render_template(template, context):
+    """Fill a notification template; missing fields render as empty strings"""
+    return ''.join(
+        literal + (str(context.get(field, '')) if field else '')
+        for literal, field in _parse_template(template)
+    )
+
+
+# Транслітерація кирилиці за українською національною системою (+ російські літери),
+# щоб «Київ», «КИЇВ» і «Kyiv» мали однаковий ключ пошуку
+_TRANSLIT = {
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'h', 'ґ': 'g', 'д': 'd', 'е': 'e', 'є': 'ie',
+    'ж': 'zh', 'з': 'z', 'и': 'y', 'і': 'i', 'ї': 'i', 'й': 'i', 'к': 'k', 'л': 'l',
+    'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't', 'у': 'u',
+    'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'shch', 'ь': '',
+    'ю': 'iu', 'я': 'ia', 'ы': 'y', 'э': 'e', 'ё': 'e', 'ъ': '',
+}
+# На початку слова йотовані літери передаються інакше
+_TRANSLIT_INITIAL = {'є': 'ye', 'ї': 'yi', 'й': 'y', 'ю': 'yu', 'я': 'ya'}
+
+
+@lru_cache(maxsize=4096)
+def city_search_key(city):
+    """Search key for a city name: casefolded, transliterated to Latin, letters and digits only"""
+    text = unicodedata.normalize('NFC', city.casefold()).replace('зг', 'зґг')
+    latin = []
+    word_start = True
+    for char in text:
+        if word_start and char in _TRANSLIT_INITIAL:
+            latin.append(_TRANSLIT_INITIAL[char])
+        else:
+            latin.append(_TRANSLIT.get(char, char))
+        word_start = not char.isalnum() and char not in "'’ʼ"
+    # Діакритику латиниці (ł, é, ö ...) відкидаємо, як і пробіли, дефіси й апострофи
+    text = unicodedata.normalize('NFKD', ''.join(latin))
+    return ''.join(char for char in text if char.isalnum())[:255]
+
 
 # Модель маршруту: шлях доставки від точки А до Б
 # Створюють компанії, перевізники подають ставки, після прийняття виконують доставку
@@ -136,15 +187,53 @@ class Route(models.Model):
         auto_now=True,  # оновлюється при збереженні
         verbose_name='Оновлено'
     )
+    
+    # Ключі пошуку міст (city_search_key), оновлюються в save()
+    origin_city_key = models.CharField(
+        max_length=255,
+        default='',
+        editable=False,
+        verbose_name='Ключ міста відправлення'
+    )
+    destination_city_key = models.CharField(
+        max_length=255,
+        default='',
+        editable=False,
+        verbose_name='Ключ міста призначення'
+    )
 
     class Meta:
         verbose_name = 'Маршрут'
         verbose_name_plural = 'Маршрути'
         ordering = ['-created_at']
+        indexes = [
+            # varchar_pattern_ops (лише PostgreSQL) дозволяє індексний LIKE 'префікс%'
+            models.Index(fields=['origin_city_key'], name='route_origin_city_key_idx', opclasses=['varchar_pattern_ops']),
+            # Нечіткий пошук міста (оператор %) — лише PostgreSQL
+            TrigramIndex('origin_city_key', name='route_origin_city_trgm_idx'),
+        ]
 
     def __str__(self):
         return f"{self.origin_city} → {self.destination_city} ({self.status})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Місто відправлення з бази: довідник міст скидається лише при його зміні
+        instance._loaded_origin_city = instance.__dict__.get('origin_city')
+        return instance
+
+    @property
+    def origin_city_changed(self):
+        """Whether origin_city differs from the value loaded from the database"""
+        return self.origin_city != getattr(self, '_loaded_origin_city', None)
+
+    def save(self, *args, **kwargs):
+        self.origin_city_key = city_search_key(self.origin_city)
+        self.destination_city_key = city_search_key(self.destination_city)
+        super().save(*args, **kwargs)
+        self._loaded_origin_city = self.origin_city
+
 
 # Модель ставки перевізника; компанія обирає максимум одну ставку на маршрут
 class Bid(models.Model):
@@ -267,18 +356,86 @@ class Tracking(models.Model):
         return f"Відстеження {self.route} - {self.progress_percent}%"
 
 
-# Повідомлення між компанією та перевізником щодо маршруту
-class Message(models.Model):
-    """Message between company and carrier"""
+# Розмова між компанією та перевізником
+# Може стосуватися конкретного маршруту або бути прямим чатом (route=None)
+class Conversation(models.Model):
+    """Chat between company and carrier"""
     
-    # Маршрут, до якого належить повідомлення (при видаленні зникає)
-    route = models.ForeignKey(
+    # Компанія-учасник розмови
+    company = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='company_conversations',  # доступ через company.company_conversations.all()
+        limit_choices_to={'role': 'company'},
+        verbose_name='Компанія'
+    )
+    
+    # Перевізник-учасник розмови
+    carrier = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='carrier_conversations',  # доступ через carrier.carrier_conversations.all()
+        limit_choices_to={'role': 'carrier'},
+        verbose_name='Перевізник'
+    )
+    
+    # Маршрут, якого стосується розмова (None — прямий чат між користувачами)
+    route = models.OneToOneField(
         Route,
         on_delete=models.CASCADE,
-        related_name='messages',  # доступ через route.messages.all()
+        null=True,
+        blank=True,
+        related_name='conversation',  # доступ через route.conversation
         verbose_name='Маршрут'
     )
     
+    # Мітки часу
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Створено'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Оновлено'
+    )
+
+    class Meta:
+        verbose_name = 'Розмова'
+        verbose_name_plural = 'Розмови'
+        ordering = ['-updated_at']
+        constraints = [
+            # Прямий чат між компанією та перевізником лише один
+            models.UniqueConstraint(
+                fields=['company', 'carrier'],
+                condition=models.Q(route__isnull=True),
+                name='unique_direct_conversation',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.company.username} ↔ {self.carrier.username}"
+
+    # Чи є користувач учасником розмови
+    def has_participant(self, user):
+        return user.pk in (self.company_id, self.carrier_id)
+
+    # Співрозмовник для переданого учасника
+    def other_participant(self, user):
+        return self.carrier if user.pk == self.company_id else self.company
+
+
+# Повідомлення між компанією та перевізником у межах розмови
+class Message(models.Model):
+    """Message between company and carrier"""
+    
+    # Розмова, до якої належить повідомлення (при видаленні зникає)
+    conversation = models.ForeignKey(
+        Conversation,
+        on_delete=models.CASCADE,
+        related_name='messages',  # доступ через conversation.messages.all()
+        verbose_name='Розмова'
+    )
+    
     # Відправник (компанія чи перевізник)
     sender = models.ForeignKey(
         'accounts.User',
@@ -300,12 +457,6 @@ class Message(models.Model):
         verbose_name='Текст повідомлення'
     )
     
-    # Позначка про прочитання
-    is_read = models.BooleanField(
-        default=False,
-        verbose_name='Прочитано'
-    )
-    
     # Час відправлення
     created_at = models.DateTimeField(
         auto_now_add=True,
@@ -316,11 +467,72 @@ class Message(models.Model):
         verbose_name = 'Повідомлення'
         verbose_name_plural = 'Повідомлення'
         ordering = ['-created_at']
+        indexes = [
+            # Історія розмови сторінками з кінця (keyset по created_at, id)
+            models.Index(fields=['conversation', 'created_at', 'id'], name='message_history_idx'),
+        ]
 
     def __str__(self):
         return f"{self.sender.username} → {self.recipient.username}: {self.content[:50]}"
 
 
+# Стан розмови для кожного учасника: лічильник непрочитаних, водяний знак прочитання та останнє повідомлення
+# Оновлюється разом із повідомленнями (logistics.inbox), щоб бейджі не рахували таблицю повідомлень
+class ConversationParticipant(models.Model):
+    """Per-participant unread counter of a conversation"""
+
+    # Розмова
+    conversation = models.ForeignKey(
+        Conversation,
+        on_delete=models.CASCADE,
+        related_name='participants',  # доступ через conversation.participants.all()
+        verbose_name='Розмова'
+    )
+
+    # Учасник (компанія чи перевізник)
+    user = models.ForeignKey(
+        'accounts.User',
+        on_delete=models.CASCADE,
+        related_name='conversation_states',  # доступ через user.conversation_states.all()
+        verbose_name='Учасник'
+    )
+
+    # Кількість непрочитаних повідомлень, адресованих учаснику
+    unread_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Непрочитані'
+    )
+
+    # Водяний знак прочитання: усі повідомлення з id <= last_read_id прочитані учасником
+    last_read_id = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name='Прочитано до повідомлення'
+    )
+
+    # Останнє повідомлення розмови
+    last_message = models.ForeignKey(
+        Message,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='+',
+        verbose_name='Останнє повідомлення'
+    )
+
+    class Meta:
+        verbose_name = 'Учасник розмови'
+        verbose_name_plural = 'Учасники розмов'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['conversation', 'user'],
+                name='unique_conversation_participant',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}: {self.unread_count}"
+
+
 # Сповіщення в застосунку: ставки, повідомлення, оновлення маршрутів тощо
 class Notification(models.Model):
     """User notification model"""
@@ -337,6 +549,20 @@ class Notification(models.Model):
         ('route_expired', 'Маршрут просрочений'),     # маршрут прострочений
     ]
     
+    # Шаблони тексту: (заголовок, текст[, заголовок для кількох подій]).
+    # Поля беруться з params і з пов'язаного маршруту (origin, destination, pickup),
+    # тож після редагування маршруту текст сповіщення теж актуальний
+    TEMPLATES = {
+        'new_bid': ('Нова ставка', 'Перевізник {carrier} зробив ставку на маршрут {origin} → {destination}'),
+        'bid_accepted': ('Вашу ставку прийнято!', 'Компанія {company} прийняла вашу ставку на маршрут {origin} → {destination}'),
+        'bid_rejected': ('Вашу ставку відхилено', 'Ставку на маршрут {origin} → {destination} відхилено'),
+        'new_message': ('Нове повідомлення', 'Від {sender}: {preview}...', 'Нові повідомлення: {count}'),
+        'route_assigned': ('Вам призначено маршрут', 'Вам призначено маршрут {origin} → {destination}'),
+        'route_completed': ('Маршрут завершено', 'Маршрут {origin} → {destination} успішно завершено'),
+        'tracking_updated': ('Оновлено відстеження', 'Прогрес доставки оновлено до {progress}% для маршруту {origin} → {destination}'),
+        'route_expired': ('Маршрут просрочений', 'Маршрут {origin} → {destination} просрочений. Ніхто не прийняв ставку до часу забору ({pickup}).'),
+    }
+    
     # Отримувач сповіщення
     user = models.ForeignKey(
         'accounts.User',
@@ -352,17 +578,26 @@ class Notification(models.Model):
         verbose_name='Тип сповіщення'
     )
     
-    # Заголовок
+    # Заголовок і текст задані явно (старі записи); нові зберігають лише params
     title = models.CharField(
         max_length=255,
+        blank=True,
+        default='',
         verbose_name='Заголовок'
     )
-    
-    # Текст
     message = models.TextField(
+        blank=True,
+        default='',
         verbose_name='Текст сповіщення'
     )
     
+    # Параметри шаблону (імена користувачів, прогрес тощо)
+    params = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name='Параметри'
+    )
+    
     # Дотичний маршрут (може бути None)
     route = models.ForeignKey(
         Route,
@@ -373,12 +608,28 @@ class Notification(models.Model):
         verbose_name='Маршрут'
     )
     
+    # Дотична розмова для сповіщень про повідомлення (може бути None)
+    conversation = models.ForeignKey(
+        Conversation,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='notifications',  # доступ через conversation.notifications.all()
+        verbose_name='Розмова'
+    )
+    
     # Прапорець прочитано/непрочитано
     is_read = models.BooleanField(
         default=False,
         verbose_name='Прочитано'
     )
     
+    # Скільки подій згорнуто в це сповіщення (нові повідомлення однієї розмови)
+    count = models.PositiveIntegerField(
+        default=1,
+        verbose_name='Кількість'
+    )
+    
     # Час створення
     created_at = models.DateTimeField(
         auto_now_add=True,
@@ -389,9 +640,55 @@ class Notification(models.Model):
         verbose_name = 'Сповіщення'
         verbose_name_plural = 'Сповіщення'
         ordering = ['-created_at']
+        indexes = [
+            # Непрочитані користувача: список, COUNT і версія для опитування читаються з індексу
+            models.Index(fields=['user', 'is_read', '-created_at'], name='notification_user_unread_idx'),
+        ]
+        constraints = [
+            # Про прострочення маршруту повідомляємо компанію лише один раз
+            models.UniqueConstraint(
+                fields=['user', 'notification_type', 'route'],
+                condition=models.Q(notification_type='route_expired'),
+                name='unique_route_expired_notification',
+            ),
+            # Непрочитане сповіщення про нові повідомлення — одне на розмову
+            models.UniqueConstraint(
+                fields=['user', 'conversation'],
+                condition=models.Q(notification_type='new_message', is_read=False),
+                name='unique_unread_message_notification',
+            ),
+        ]
 
     def __str__(self):
-        return f"{self.user.username}: {self.title}"
+        return f"{self.user.username}: {self.rendered_title}"
+
+    def _render(self, template):
+        context = {'count': self.count, **self.params}
+        # Маршрут підтягуємо, лише якщо шаблон справді використовує його поля
+        fields = {field for _, field in _parse_template(template)}
+        if self.route_id and fields & {'origin', 'destination', 'pickup'}:
+            route = self.route
+            context.update({
+                'origin': route.origin_city,
+                'destination': route.destination_city,
+                'pickup': timezone.localtime(route.pickup_date).strftime('%d.%m.%Y %H:%M'),
+            })
+        return render_template(template, context)
+
+    @property
+    def rendered_title(self):
+        if self.title:
+            return self.title
+        template = self.TEMPLATES[self.notification_type]
+        if self.count > 1 and len(template) > 2:
+            return self._render(template[2])
+        return self._render(template[0])
+
+    @property
+    def rendered_message(self):
+        if self.message:
+            return self.message
+        return self._render(self.TEMPLATES[self.notification_type][1])
 
 
 class Rating(models.Model):
@@ -0,0 +1,254 @@
+"""
+Сервіс сповіщень.
+Усі виробники створюють сповіщення через notify(): у межах collect_notifications()
+(запит або фонова задача) вони накопичуються й записуються одним bulk_create
+після коміту. Типи з COALESCED_TYPES не вставляються щоразу: нове сповіщення
+згортається з непрочитаним того ж користувача по тій самій розмові (лічильник
+count). З NOTIFICATIONS_DEFERRED запис виконує фоновий потік процесу, який ще й
+об'єднує пачки кількох запитів.
+Кількість непрочитаних сповіщень користувача живе в кеші: бейдж та API
+читають готове число, а створення/прочитання сповіщень лише зсуває його.
+Якщо ключа немає (перший запит, перезапуск, скидання) — рахуємо COUNT один раз.
+"""
+
+import logging
+import queue
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Notification
+from .realtime import publish_notification
+
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+# Одне непрочитане сповіщення на розмову (обмеження unique_unread_message_notification)
+COALESCED_TYPES = {'new_message'}
+
+
+def _batches():
+    if not hasattr(_local, 'batches'):
+        _local.batches = []
+    return _local.batches
+
+
+@contextmanager
+def collect_notifications():
+    """Collect notify() calls and write them with one bulk_create on exit.
+
+    Usable as a view decorator. Nothing is written if the block raises.
+    """
+    batch = []
+    _batches().append(batch)
+    try:
+        yield batch
+    finally:
+        _batches().pop()
+    # Після винятку сюди не доходимо — сповіщення про невдалу дію не пишемо
+    if batch:
+        _dispatch_on_commit(batch)
+
+
+def notify(user, notification_type, route=None, conversation=None, **params):
+    """Queue a notification for the current batch (or write it right away outside one).
+
+    Text is not stored: params fill Notification.TEMPLATES when it is displayed.
+    """
+    notification = Notification(
+        user=user,
+        notification_type=notification_type,
+        route=route,
+        conversation=conversation,
+        params=params,
+    )
+    if route is None and conversation is not None:
+        # Сповіщення про чат маршруту посилається й на сам маршрут
+        notification.route_id = conversation.route_id
+    batches = _batches()
+    if batches:
+        batches[-1].append(notification)
+    else:
+        _dispatch_on_commit([notification])
+    return notification
+
+
+def _dispatch_on_commit(notifications):
+    if settings.NOTIFICATIONS_DEFERRED:
+        transaction.on_commit(lambda: _enqueue(notifications))
+    else:
+        transaction.on_commit(lambda: write_notifications(notifications))
+
+
+def write_notifications(notifications, ignore_conflicts=False):
+    """Insert notifications in one query, push them and update unread counters.
+
+    bulk_create bypasses post_save, so the signal's work is repeated here.
+    With ignore_conflicts the rows actually inserted are re-read, so skipped
+    duplicates are neither pushed nor counted. Pushes and counters run after
+    commit. COALESCED_TYPES are upserted one by one.
+    """
+    for notification in notifications:
+        if notification.notification_type in COALESCED_TYPES:
+            _write_coalesced(notification)
+    notifications = [n for n in notifications if n.notification_type not in COALESCED_TYPES]
+    if not notifications:
+        return
+    if ignore_conflicts:
+        notifications = _insert_ignoring_conflicts(notifications)
+    else:
+        Notification.objects.bulk_create(notifications)
+    transaction.on_commit(lambda: _publish_all(notifications))
+    for user_id, count in Counter(n.user_id for n in notifications).items():
+        adjust_unread_notifications(user_id, count)
+
+
+def _insert_ignoring_conflicts(notifications):
+    """bulk_create with ignore_conflicts; returns only the inserted rows, with pks"""
+    # Пропущені дублікати bulk_create не позначає, а pk не виставляє —
+    # вставлені рядки знаходимо за ключем унікальних обмежень (користувач, тип, маршрут)
+    rows = Notification.objects.filter(
+        user_id__in={n.user_id for n in notifications},
+        notification_type__in={n.notification_type for n in notifications},
+        route_id__in={n.route_id for n in notifications},
+    )
+    existing = set(rows.values_list('pk', flat=True))
+    Notification.objects.bulk_create(notifications, ignore_conflicts=True)
+    # Маршрут підтягуємо JOIN-ом: текст для push рендериться без додаткових запитів
+    keys = {(n.user_id, n.notification_type, n.route_id) for n in notifications}
+    return [
+        row for row in rows.exclude(pk__in=existing).select_related('route')
+        if (row.user_id, row.notification_type, row.route_id) in keys
+    ]
+
+
+def _publish_all(notifications):
+    for notification in notifications:
+        publish_notification(notification)
+
+
+def _write_coalesced(notification):
+    """Insert the notification or fold it into the user's unread one for the same conversation"""
+    unread = Notification.objects.filter(
+        user_id=notification.user_id,
+        notification_type=notification.notification_type,
+        conversation_id=notification.conversation_id,
+        is_read=False,
+    )
+    with transaction.atomic():
+        while True:
+            existing = unread.select_for_update().first()
+            if existing is None:
+                try:
+                    # Окремий savepoint: паралельний запит міг щойно створити сповіщення.
+                    # Push і лічильник для нового рядка робить сигнал post_save
+                    with transaction.atomic():
+                        notification.save()
+                    return notification
+                except IntegrityError:
+                    continue
+            # Лічильник збільшуємо в базі; created_at оновлюємо, щоб сповіщення піднялося вгору.
+            # Текст старого формату очищаємо — далі він рендериться з шаблону
+            existing.count += 1
+            existing.title = existing.message = ''
+            existing.params = notification.params
+            existing.created_at = timezone.now()
+            updated = unread.filter(pk=existing.pk).update(
+                count=F('count') + 1,
+                title='',
+                message='',
+                params=existing.params,
+                created_at=existing.created_at,
+            )
+            if updated:
+                break
+            # Сповіщення щойно прочитали — повідомлення починає нове
+    # Кількість непрочитаних сповіщень не змінилась — клієнт лише оновлює список
+    transaction.on_commit(lambda: publish_notification(existing, unread_delta=0))
+    return existing
+
+
+# Фонова черга процесу: запит лише кладе пачку, запис іде в окремому потоці.
+# Незаписані сповіщення втрачаються при аварійному завершенні процесу
+_queue = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def _enqueue(notifications):
+    global _worker
+    with _worker_lock:
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run_worker, name='notifications-writer', daemon=True)
+            _worker.start()
+    _queue.put(notifications)
+
+
+def drain_queue(notifications=()):
+    """Write everything currently queued with one bulk_create, returns the number written"""
+    notifications = list(notifications)
+    while True:
+        try:
+            notifications.extend(_queue.get_nowait())
+        except queue.Empty:
+            break
+    if notifications:
+        write_notifications(notifications)
+    return len(notifications)
+
+
+def _run_worker():
+    while True:
+        # Чекаємо першу пачку, решту накопиченого забираємо разом з нею
+        first = _queue.get()
+        try:
+            drain_queue(first)
+        except Exception:
+            logger.exception('Failed to write queued notifications')
+        finally:
+            close_old_connections()
+
+
+# Лічильник періодично перераховується, тож випадкове розходження з базою тимчасове
+UNREAD_NOTIFICATIONS_TIMEOUT = 10 * 60
+
+
+def _unread_key(user_id):
+    return f'logistics:notifications:unread:{user_id}'
+
+
+def unread_notifications_count(user_id):
+    """Cached number of the user's unread notifications"""
+    key = _unread_key(user_id)
+    count = cache.get(key)
+    if count is None:
+        count = Notification.objects.filter(user_id=user_id, is_read=False).count()
+        cache.add(key, count, UNREAD_NOTIFICATIONS_TIMEOUT)
+    return count
+
+
+def _incr(user_id, delta):
+    try:
+        cache.incr(_unread_key(user_id), delta)
+    except ValueError:
+        # Ключа немає — наступне читання порахує значення з бази
+        pass
+
+
+# Зсуваємо лічильник лише після коміту, щоб відкат транзакції його не зіпсував
+def adjust_unread_notifications(user_id, delta):
+    transaction.on_commit(lambda: _incr(user_id, delta))
+
+
+def invalidate_unread_notifications(*user_ids):
+    """Drop cached counters so the next read recounts them (after commit)"""
+    keys = [_unread_key(user_id) for user_id in user_ids]
+    transaction.on_commit(lambda: cache.delete_many(keys))
@@ -0,0 +1,57 @@
+"""
+Адаптивний інтервал резервного опитування (sync_api).
+Сервер підказує клієнту, коли прийти наступного разу:
+- з відкритим чатом і свіжими змінами — часто;
+- поки змін немає — інтервал подвоюється (клієнт повертає лічильник idle);
+- під навантаженням інтервал розтягується для всіх, крім активного чату.
+Навантаження — кількість опитувань за вікно в кеші (спільна з REDIS_URL).
+"""
+
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+# Інтервали в секундах: відкритий чат і решта розділів
+POLL_CHAT_DELAY = 3
+POLL_CHAT_MAX_DELAY = 30
+POLL_IDLE_DELAY = 30
+POLL_MAX_DELAY = 120
+
+# Вікно підрахунку опитувань і максимальне розтягування під навантаженням
+POLL_LOAD_WINDOW = 10
+POLL_MAX_STRETCH = 4
+
+# Вище цього показника idle не росте — інтервал уже впирається в стелю
+POLL_MAX_IDLE = 10
+
+
+def _record_poll():
+    """Count this poll in the current window, returns polls so far"""
+    key = f'logistics:polls:{int(time.time() // POLL_LOAD_WINDOW)}'
+    cache.add(key, 0, POLL_LOAD_WINDOW * 2)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Ключ щойно витіснили — вважаємо опитування першим у вікні
+        return 1
+
+
+def load_stretch(polls):
+    """Interval multiplier for the given number of polls in the window"""
+    return min(max(polls / settings.POLL_LOAD_THRESHOLD, 1), POLL_MAX_STRETCH)
+
+
+def next_poll_delay(idle, chat_open):
+    """Recommended delay in seconds before the next sync poll"""
+    idle = min(idle, POLL_MAX_IDLE)
+    if chat_open:
+        delay = min(POLL_CHAT_DELAY * 2 ** idle, POLL_CHAT_MAX_DELAY)
+    else:
+        delay = min(POLL_IDLE_DELAY * 2 ** idle, POLL_MAX_DELAY)
+    stretch = load_stretch(_record_poll())
+    # Активну розмову не сповільнюємо, щоб пік навантаження не ламав живий чат
+    if chat_open and idle == 0:
+        return delay
+    return round(min(delay * stretch, POLL_MAX_DELAY * POLL_MAX_STRETCH))
@@ -0,0 +1,243 @@
+"""
+Доставка подій у реальному часі (Server-Sent Events).
+Views публікують події в канал, а async-потоки SSE підписуються на нього.
+Канали: розмова (нові повідомлення) та користувач (сповіщення, лічильники).
+Брокер обирається налаштуванням REALTIME_BROKER:
+- LocalBroker — пам'ять процесу (розробка, один воркер);
+- RedisBroker — Redis pub/sub, спільний для кількох воркерів (потрібен REDIS_URL).
+"""
+
+import asyncio
+import json
+import threading
+from abc import ABC, abstractmethod
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils.module_loading import import_string
+
+
+# Як часто надсилаємо heartbeat і звіряємося з базою, якщо подій немає (секунди)
+SSE_HEARTBEAT_INTERVAL = 15
+
+# Максимальна тривалість одного потоку; браузер сам перепідключиться з Last-Event-ID
+SSE_STREAM_LIFETIME = 5 * 60
+
+# Через скільки мілісекунд EventSource перепідключається після розриву
+SSE_RETRY_MS = 3000
+
+
+class Subscription(ABC):
+    """Queue of events received on a channel (async context manager)"""
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.queue = asyncio.Queue()
+
+    async def get(self, timeout):
+        """Wait for the next event payload, returns None on timeout"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def __aenter__(self):
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    @abstractmethod
+    async def open(self):
+        """Start receiving events of the channel"""
+
+    @abstractmethod
+    async def close(self):
+        """Stop receiving events and release the connection"""
+
+
+# Клас замість генератора: відписка не залежить від порядку фіналізації async-генераторів
+class LocalSubscription(Subscription):
+
+    def __init__(self, broker, channel):
+        super().__init__(channel)
+        self.broker = broker
+        self.loop = None
+
+    async def open(self):
+        self.loop = asyncio.get_running_loop()
+        with self.broker._lock:
+            self.broker._subscribers[self.channel].add(self)
+
+    async def close(self):
+        with self.broker._lock:
+            subscribers = self.broker._subscribers.get(self.channel)
+            if subscribers is not None:
+                subscribers.discard(self)
+                if not subscribers:
+                    del self.broker._subscribers[self.channel]
+
+
+# Брокер у пам'яті процесу: події бачать лише підписники цього ж воркера
+class LocalBroker:
+    """In-process pub/sub broker"""
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, payload):
+        """Deliver payload to every subscriber of the channel (safe from any thread)"""
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            # Підписник живе в event loop ASGI-сервера, а публікація йде з sync-view
+            subscription.loop.call_soon_threadsafe(subscription.queue.put_nowait, payload)
+
+    def subscribe(self, channel):
+        return LocalSubscription(self, channel)
+
+
+class RedisSubscription(Subscription):
+
+    def __init__(self, url, channel):
+        super().__init__(channel)
+        self.url = url
+        self.client = None
+        self.pubsub = None
+        self.task = None
+
+    async def open(self):
+        import redis.asyncio as aioredis
+
+        self.client = aioredis.Redis.from_url(self.url)
+        self.pubsub = self.client.pubsub()
+        await self.pubsub.subscribe(self.channel)
+        self.task = asyncio.create_task(self._read())
+
+    # Перекладаємо повідомлення Redis у локальну чергу підписки
+    async def _read(self):
+        async for item in self.pubsub.listen():
+            if item['type'] == 'message':
+                self.queue.put_nowait(json.loads(item['data']))
+
+    async def close(self):
+        self.task.cancel()
+        await self.pubsub.unsubscribe(self.channel)
+        await self.pubsub.close()
+        await self.client.close()
+
+
+# Брокер на Redis pub/sub для кількох воркерів (пакет redis потрібен і для RedisCache)
+class RedisBroker:
+    """Redis pub/sub broker"""
+
+    def __init__(self, url=None):
+        self.url = url or settings.REDIS_URL
+        self._client = None
+
+    def publish(self, channel, payload):
+        if self._client is None:
+            import redis
+            self._client = redis.Redis.from_url(self.url)
+        self._client.publish(channel, json.dumps(payload))
+
+    def subscribe(self, channel):
+        return RedisSubscription(self.url, channel)
+
+
+_broker = None
+
+
+def get_broker():
+    """Return the configured broker instance (created once per process)"""
+    global _broker
+    if _broker is None:
+        _broker = import_string(settings.REALTIME_BROKER)()
+    return _broker
+
+
+def conversation_channel(conversation_id):
+    return f'logistics:conversation:{conversation_id}'
+
+
+def user_channel(user_id):
+    return f'logistics:user:{user_id}'
+
+
+# Публікуємо лише після коміту, щоб підписник точно знайшов рядок у базі
+def publish_on_commit(channel, payload):
+    transaction.on_commit(lambda: get_broker().publish(channel, payload))
+
+
+# Подія для особистого каналу користувача; event — назва SSE-події на клієнті
+def publish_user_event(user_id, event, **data):
+    publish_on_commit(user_channel(user_id), {'event': event, **data})
+
+
+# JSON-представлення сповіщення (API та SSE-потік)
+def notification_data(notification):
+    return {
+        'id': notification.id,
+        'type': notification.notification_type,
+        'title': notification.rendered_title,
+        'message': notification.rendered_message,
+        'created_at': notification.created_at.strftime('%d.%m.%Y %H:%M'),
+        'route_id': notification.route_id,
+        'conversation_id': notification.conversation_id,
+        'count': notification.count,
+    }
+
+
+def publish_notification(notification, unread_delta=1):
+    """Push a notification and its unread counter delta to its user"""
+    publish_user_event(
+        notification.user_id, 'notification',
+        notification=notification_data(notification), unread_delta=unread_delta
+    )
+
+
+def sse_event(event, data, event_id=None):
+    """Format one Server-Sent Events frame"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append(f'data: {json.dumps(data, ensure_ascii=False)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+async def user_event_stream(channel, initial_events):
+    """Relay channel events as SSE frames until the stream lifetime runs out.
+
+    initial_events is an async callable producing frames sent right after
+    subscribing (e.g. absolute counters to resync the client).
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + SSE_STREAM_LIFETIME
+    yield f'retry: {SSE_RETRY_MS}\n\n'
+    async with get_broker().subscribe(channel) as subscription:
+        for frame in await initial_events():
+            yield frame
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return
+            payload = await subscription.get(min(SSE_HEARTBEAT_INTERVAL, remaining))
+            if payload is None:
+                yield ': heartbeat\n\n'
+            else:
+                payload = dict(payload)
+                yield sse_event(payload.pop('event'), payload)
+
+
+def sse_response(stream):
+    """Wrap an async SSE generator into a non-buffered streaming response"""
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Вимикаємо буферизацію проксі (nginx), інакше події приходять пачками
+    response['X-Accel-Buffering'] = 'no'
+    return response
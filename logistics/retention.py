@@ -0,0 +1,73 @@
+"""
+Зберігання прочитаних сповіщень.
+Строк задає NOTIFICATION_RETENTION_DAYS окремо для кожного типу (default — для решти).
+Команда `python manage.py prune_notifications` видаляє прочитані сповіщення,
+старші за строк, невеликими транзакціями; з --archive спершу дописує їх у файл
+JSON Lines. Непрочитані сповіщення ніколи не видаляються.
+"""
+
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Notification
+
+
+# Скільки сповіщень видаляємо за одну транзакцію
+PRUNE_CHUNK_SIZE = 1000
+
+ARCHIVE_FIELDS = (
+    'id', 'user_id', 'notification_type', 'title', 'message', 'params',
+    'route_id', 'conversation_id', 'count', 'created_at',
+)
+
+
+def retention_cutoffs(now=None):
+    """Return {notification_type: cutoff} for every type that has a retention period"""
+    now = now or timezone.now()
+    policy = settings.NOTIFICATION_RETENTION_DAYS
+    cutoffs = {}
+    for notification_type, _ in Notification.NOTIFICATION_TYPES:
+        days = policy.get(notification_type, policy.get('default'))
+        if days is not None:
+            cutoffs[notification_type] = now - timedelta(days=days)
+    return cutoffs
+
+
+def _archive(rows, archive):
+    for row in rows:
+        row['created_at'] = row['created_at'].isoformat()
+        archive.write(json.dumps(row, ensure_ascii=False) + '\n')
+    archive.flush()
+
+
+def prune_notifications(now=None, chunk_size=PRUNE_CHUNK_SIZE, archive=None):
+    """Delete read notifications past their retention period.
+
+    archive — optional text file; pruned rows are appended to it as JSON Lines
+    before deletion. Returns {notification_type: deleted count}.
+    """
+    deleted = {}
+    for notification_type, cutoff in retention_cutoffs(now).items():
+        expired = Notification.objects.filter(
+            notification_type=notification_type, is_read=True, created_at__lt=cutoff
+        )
+        total = 0
+        while True:
+            with transaction.atomic():
+                # Найстаріші рядки мають найменші id — обхід за pk швидко знаходить пачку
+                ids = list(expired.order_by('pk').values_list('pk', flat=True)[:chunk_size])
+                if not ids:
+                    break
+                chunk = Notification.objects.filter(pk__in=ids)
+                if archive is not None:
+                    _archive(chunk.order_by('pk').values(*ARCHIVE_FIELDS), archive)
+                # Рядки прочитані, тож лічильник непрочитаних не змінюється
+                chunk.delete()
+            total += len(ids)
+        if total:
+            deleted[notification_type] = total
+    return deleted
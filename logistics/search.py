@@ -0,0 +1,96 @@
+"""
+Повнотекстовий пошук по повідомленнях чату.
+Індекс створює міграція 0018 залежно від бази:
+- SQLite — віртуальна таблиця FTS5, яку синхронізують тригери на logistics_message;
+- PostgreSQL — GIN-індекс за виразом to_tsvector('simple', content).
+Пошук обмежений розмовами користувача, результати — від новіших до старіших
+з keyset-курсором before_id.
+"""
+
+import re
+
+from django.db import connection
+from django.utils.html import escape
+
+from .models import Message
+
+
+# Скільки результатів пошуку повертаємо за раз
+SEARCH_PAGE_SIZE = 20
+
+# Маркери збігів у фрагменті; після екранування HTML замінюються на <mark>
+_MATCH_START = '\x02'
+_MATCH_END = '\x03'
+
+_SQLITE_SEARCH = """
+    SELECT f.rowid, snippet(logistics_message_fts, 0, %s, %s, '…', 12)
+    FROM logistics_message_fts f
+    JOIN logistics_message m ON m.id = f.rowid
+    JOIN logistics_conversation c ON c.id = m.conversation_id
+    WHERE logistics_message_fts MATCH %s
+      AND (c.company_id = %s OR c.carrier_id = %s)
+      AND f.rowid < %s
+    ORDER BY f.rowid DESC
+    LIMIT %s
+"""
+
+_POSTGRES_SEARCH = """
+    SELECT m.id, ts_headline('simple', m.content, q.query, %s)
+    FROM logistics_message m
+    JOIN logistics_conversation c ON c.id = m.conversation_id,
+         to_tsquery('simple', %s) AS q(query)
+    WHERE to_tsvector('simple', m.content) @@ q.query
+      AND (c.company_id = %s OR c.carrier_id = %s)
+      AND m.id < %s
+    ORDER BY m.id DESC
+    LIMIT %s
+"""
+
+
+# Слова запиту без службових символів FTS — довільний ввід не ламає синтаксис
+def _search_terms(query):
+    return re.findall(r'\w+', query.lower())
+
+
+def _match_expression(terms):
+    """Prefix AND-query in the syntax of the current database"""
+    if connection.vendor == 'postgresql':
+        return ' & '.join(f'{term}:*' for term in terms)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def _highlight(snippet):
+    return escape(snippet).replace(_MATCH_START, '<mark>').replace(_MATCH_END, '</mark>')
+
+
+def search_messages(user, query, before_id=None, limit=None):
+    """Return (messages newest first, has_more) matching query in the user's conversations.
+
+    Every message gets a ``snippet`` attribute: escaped HTML with matches in <mark>.
+    """
+    limit = limit or SEARCH_PAGE_SIZE
+    terms = _search_terms(query)
+    if not terms:
+        return [], False
+
+    # Без курсора беремо все: id завжди менший за максимальний BIGINT
+    cursor_id = before_id or 2 ** 63 - 1
+    match = _match_expression(terms)
+    if connection.vendor == 'postgresql':
+        options = f'StartSel={_MATCH_START}, StopSel={_MATCH_END}, MaxWords=24, MinWords=8'
+        sql, params = _POSTGRES_SEARCH, [options, match, user.pk, user.pk, cursor_id, limit + 1]
+    else:
+        sql, params = _SQLITE_SEARCH, [_MATCH_START, _MATCH_END, match, user.pk, user.pk, cursor_id, limit + 1]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+
+    has_more = len(rows) > limit
+    snippets = dict(rows[:limit])
+    messages = Message.objects.filter(pk__in=snippets).select_related(
+        'sender', 'conversation__company', 'conversation__carrier'
+    ).order_by('-pk')
+    results = list(messages)
+    for message in results:
+        message.snippet = _highlight(snippets[message.pk])
+    return results, has_more
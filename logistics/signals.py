@@ -0,0 +1,43 @@
+"""
+Обробники сигналів логістики.
+Кожне нове сповіщення після коміту надсилається в особистий SSE-канал користувача
+і збільшує кешований лічильник непрочитаних.
+Обробника post_delete для сповіщень немає навмисно: він вимкнув би пакетне
+видалення (каскади, prune_notifications). Лічильники скидають місця видалення.
+Зміна чи видалення маршруту скидає спільну стрічку pending-маршрутів, а довідник
+міст — лише створення, видалення та зміна міста відправлення.
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cities import invalidate_city_index
+from .feed import invalidate_pending_feed
+from .models import Notification, Route
+from .notifications import adjust_unread_notifications
+from .realtime import publish_notification
+
+
+# Push і лічильник — лише після коміту: відкочене сповіщення не має дійти до клієнта
+@receiver(post_save, sender=Notification)
+def push_created_notification(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(lambda: publish_notification(instance))
+        if not instance.is_read:
+            adjust_unread_notifications(instance.user_id, 1)
+
+
+# Створення, редагування, прийняття ставки й видалення проходять через save()/delete()
+@receiver(post_save, sender=Route)
+def reset_route_caches(sender, instance, created, **kwargs):
+    invalidate_pending_feed()
+    # Довідник міст рахує маршрути за містом відправлення: статус і трекінг його не змінюють
+    if created or instance.origin_city_changed:
+        invalidate_city_index()
+
+
+@receiver(post_delete, sender=Route)
+def reset_route_caches_on_delete(sender, **kwargs):
+    invalidate_pending_feed()
+    invalidate_city_index()
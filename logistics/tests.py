@@ -1,10 +1,25 @@
-from django.test import TestCase, Client
+import io
+import json
+import os
+import tempfile
+
+from asgiref.sync import sync_to_async
+from django.test import TestCase, Client, override_settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.urls import reverse
 from django.utils import timezone
 from datetime import timedelta
+from unittest.mock import patch
 from accounts.models import User, CompanyProfile, CarrierProfile
-from .models import Route, Bid, Tracking
+from .models import Route, Bid, Tracking, Conversation, ConversationParticipant, Message, Notification
+from .inbox import create_message
+from .retention import prune_notifications
+from .expiry import _file_lock, expire_routes, expiry_lock, check_expired_routes, get_expiry_watermark
+from . import cities, notifications, polling, realtime
+from .realtime import get_broker, conversation_channel
 
 User = get_user_model()
 
@@ -115,6 +130,8 @@ class RouteModelTest(TestCase):
 
 class RouteViewsTest(TestCase):
     def setUp(self):
+        # Спільна стрічка перевізників живе в кеші — не переносимо її між тестами
+        cache.clear()
         self.client = Client()
         self.company = User.objects.create_user(
             username='company',
@@ -164,7 +181,179 @@ class RouteViewsTest(TestCase):
         self.client.login(username='company', password='testpass')
         response = self.client.get(reverse('routes_list'))
         self.assertEqual(response.status_code, 200)
-    
+
+    def _routes_feed(self, **params):
+        response = self.client.get(
+            reverse('routes_list'), {'format': 'json', **params}, HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        )
+        return json.loads(b''.join(response.streaming_content))
+
+    def test_routes_json_feed_query_count_is_constant(self):
+        CarrierProfile.objects.create(user=self.carrier, license_number='LIC123', vehicle_type='Вантажівка')
+        Route.objects.filter(pk=self.route.pk).update(carrier=self.carrier, status='in_transit')
+        self.client.login(username='company', password='testpass')
+        # Перший запит ще рахує межу прострочення (кеш порожній)
+        self._routes_feed()
+
+        with CaptureQueriesContext(connection) as single:
+            data = self._routes_feed()
+        self.assertEqual(data['routes'][0]['carrier_name'], 'carrier')
+        self.assertEqual(data['routes'][0]['company_name'], 'Test Company')
+        self.assertEqual(data['routes'][0]['pickup_date'], self.route.pickup_date.isoformat())
+
+        for _ in range(5):
+            self.route.pk = None
+            self.route.save()
+        with self.assertNumQueries(len(single)):
+            data = self._routes_feed()
+        self.assertEqual(len(data['routes']), 6)
+
+    @override_settings(ROUTES_PAGE_SIZE=2)
+    def test_routes_list_pages_by_cursor(self):
+        # Однаковий created_at: порядок і курсор тримаються на id
+        for _ in range(4):
+            self.route.pk = None
+            self.route.save()
+        Route.objects.update(created_at=self.route.created_at)
+        self.client.login(username='company', password='testpass')
+
+        seen = []
+        data = self._routes_feed()
+        while True:
+            seen += [route['id'] for route in data['routes']]
+            if not data['has_more']:
+                break
+            data = self._routes_feed(before_id=data['next_before_id'], before_time=data['next_before_time'])
+        self.assertEqual(seen, sorted(Route.objects.values_list('pk', flat=True), reverse=True))
+        self.assertEqual(data['routes'][0]['status_display'], 'Очікує')
+
+        response = self.client.get(reverse('routes_list'))
+        self.assertEqual(len(response.context['routes']), 2)
+        self.assertEqual(response.context['next_before_id'], seen[1])
+
+        # Зіпсований курсор: HTML-сторінка показує початок, JSON-запит отримує 400
+        response = self.client.get(reverse('routes_list'), {'before_id': 'abc'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['next_before_id'], seen[1])
+        response = self.client.get(
+            reverse('routes_list'), {'format': 'json', 'before_id': 'abc'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest'
+        )
+        self.assertEqual(response.status_code, 400)
+
+    @override_settings(ROUTES_PAGE_SIZE=2)
+    def test_routes_cursor_survives_deleted_route(self):
+        for _ in range(4):
+            self.route.pk = None
+            self.route.save()
+        for username in ('company', 'carrier'):
+            with self.subTest(username=username):
+                self.client.login(username=username, password='testpass')
+                data = self._routes_feed()
+                cursor = {'before_id': data['next_before_id'], 'before_time': data['next_before_time']}
+                expected = [route['id'] for route in self._routes_feed(**cursor)['routes']]
+                self.assertTrue(expected)
+                # Маршрут курсора видалили між порціями — прокручування продовжується
+                with self.captureOnCommitCallbacks(execute=True):
+                    Route.objects.get(pk=cursor['before_id']).delete()
+                self.assertEqual([route['id'] for route in self._routes_feed(**cursor)['routes']], expected)
+
+    def test_carriers_share_cached_pending_feed(self):
+        User.objects.create_user(username='carrier2', password='testpass', email='carrier2@test.com', role='carrier')
+        self.client.login(username='carrier', password='testpass')
+        self.assertEqual([route['id'] for route in self._routes_feed()['routes']], [self.route.pk])
+
+        # Інший перевізник отримує стрічку з кешу, фільтр застосовується в пам'яті;
+        # з кешем процесу (LocMem) лишається тільки звірка статусів сторінки за id
+        self.client.login(username='carrier2', password='testpass')
+        with CaptureQueriesContext(connection) as queries:
+            data = self._routes_feed(origin_city='київ')
+        self.assertEqual(len(data['routes']), 1)
+        route_queries = [q['sql'] for q in queries if 'logistics_route' in q['sql']]
+        self.assertEqual(len(route_queries), 1)
+        self.assertIn('COUNT(', route_queries[0])
+        self.assertEqual(self._routes_feed(origin_city='Одеса')['routes'], [])
+
+        # Прийняття ставки (save маршруту) прибирає маршрут зі стрічки
+        with self.captureOnCommitCallbacks(execute=True):
+            self.route.status = 'in_transit'
+            self.route.save()
+        self.assertEqual(self._routes_feed()['routes'], [])
+
+    def test_pending_feed_drops_routes_changed_by_other_process(self):
+        self.client.login(username='carrier', password='testpass')
+        self.assertEqual([route['id'] for route in self._routes_feed()['routes']], [self.route.pk])
+        # Воркер прострочення в іншому процесі: скидання до нашого LocMem-кешу не доходить
+        Route.objects.filter(pk=self.route.pk).update(status='expired')
+        self.assertEqual(self._routes_feed()['routes'], [])
+
+    def test_city_autocomplete_uses_cached_index(self):
+        for city in ('Київ', 'Кривий Ріг', 'Львів'):
+            self.route.pk = None
+            self.route.origin_city = city
+            self.route.save()
+        self.client.login(username='carrier', password='testpass')
+        url = reverse('cities_api')
+
+        data = self.client.get(url, {'q': 'к'}).json()
+        self.assertEqual(data['cities'], [{'city': 'Київ', 'routes': 2}, {'city': 'Кривий Ріг', 'routes': 1}])
+        self.assertEqual(len(self.client.get(url, {'q': 'к', 'limit': 1}).json()['cities']), 1)
+
+        # Повторні запити не звертаються до таблиці маршрутів
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url, {'q': 'льв'})
+        self.assertFalse([q for q in queries if 'logistics_route' in q['sql']])
+
+        # Новий маршрут оновлює довідник
+        with self.captureOnCommitCallbacks(execute=True):
+            self.route.pk = None
+            self.route.origin_city = 'Луцьк'
+            self.route.save()
+        self.assertEqual(
+            [item['city'] for item in self.client.get(url, {'q': 'л'}).json()['cities']],
+            ['Луцьк', 'Львів']
+        )
+
+    def test_city_index_is_reset_only_when_origin_city_changes(self):
+        def index_key():
+            with self.captureOnCommitCallbacks(execute=True):
+                route.save()
+            return cities.CITY_INDEX_KEY.current()
+
+        route = Route.objects.get(pk=self.route.pk)
+        before = cities.CITY_INDEX_KEY.current()
+        route.status = 'in_transit'
+        self.assertEqual(index_key(), before)
+        route.origin_city = 'Одеса'
+        changed = index_key()
+        self.assertNotEqual(changed, before)
+        # Повторне збереження без зміни міста довідник не чіпає
+        self.assertEqual(index_key(), changed)
+
+    def test_city_filter_matches_normalized_prefix_and_typos(self):
+        for city in ('Львів', 'Харків'):
+            self.route.pk = None
+            self.route.origin_city = city
+            self.route.save()
+        self.assertEqual(Route.objects.get(origin_city='Харків').origin_city_key, 'kharkiv')
+
+        def origin_cities(**params):
+            return {route['origin_city'] for route in self._routes_feed(**params)['routes']}
+
+        # Компанія фільтрує в базі, перевізник — у спільній стрічці
+        for username in ('company', 'carrier'):
+            self.client.login(username=username, password='testpass')
+            self.assertEqual(origin_cities(origin_city='kyiv'), {'Київ'})
+            self.assertEqual(origin_cities(origin_city='КИЇ'), {'Київ'})
+            self.assertEqual(origin_cities(search_city='Харкив'), {'Харків'})
+            self.assertEqual(origin_cities(origin_city='Одеса'), set())
+
+        # Нечіткий пошук — лише запасний шлях, коли префікс не знайшов жодного міста
+        with patch.object(cities, 'get_close_matches', wraps=cities.get_close_matches) as close_matches:
+            self.assertEqual(origin_cities(origin_city='Ха'), {'Харків'})
+            close_matches.assert_not_called()
+            self.assertEqual(origin_cities(origin_city='Харкив'), {'Харків'})
+            close_matches.assert_called_once()
+
     def test_create_route_requires_company(self):
         self.client.login(username='carrier', password='testpass')
         response = self.client.get(reverse('create_route'))
@@ -240,3 +429,626 @@ class BidViewsTest(TestCase):
         self.client.login(username='carrier', password='testpass')
         response = self.client.get(reverse('accept_bid', args=[bid.pk]))
         self.assertEqual(response.status_code, 302)  # редірект (приймає ставка компанія)
+    
+    def test_accept_bid_writes_notifications_with_one_insert(self):
+        bid = Bid.objects.create(
+            route=self.route,
+            carrier=self.carrier,
+            proposed_price=4500.00,
+            estimated_delivery=timezone.now() + timedelta(days=3)
+        )
+        
+        self.client.login(username='company', password='testpass')
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('accept_bid', args=[bid.pk]))
+        inserts = [q for q in queries if q['sql'].startswith('INSERT INTO "logistics_notification"')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(
+            set(Notification.objects.filter(user=self.carrier).values_list('notification_type', flat=True)),
+            {'bid_accepted', 'route_assigned'}
+        )
+
+    def test_notification_text_follows_route_edit(self):
+        notification = Notification.objects.create(
+            user=self.company,
+            notification_type='new_bid',
+            route=self.route,
+            params={'carrier': 'carrier'}
+        )
+        self.assertEqual(notification.title, '')
+        self.assertIn('Перевізник carrier', notification.rendered_message)
+
+        # Текст не зберігається, тож після редагування маршруту він актуальний
+        Route.objects.filter(pk=self.route.pk).update(destination_city='Одеса')
+        notification = Notification.objects.select_related('route').get(pk=notification.pk)
+        self.assertIn(f'{self.route.origin_city} → Одеса', notification.rendered_message)
+
+
+class RouteExpiryTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.company = User.objects.create_user(
+            username='company',
+            password='testpass',
+            email='company@test.com',
+            role='company',
+            company_name='Test Company'
+        )
+    
+    def _create_route(self, pickup_date):
+        return Route.objects.create(
+            company=self.company,
+            origin_city='Київ',
+            origin_country='Україна',
+            origin_lat=50.4501,
+            origin_lng=30.5234,
+            destination_city='Львів',
+            destination_country='Україна',
+            destination_lat=49.8397,
+            destination_lng=24.0297,
+            cargo_type='Пакування',
+            weight=100.00,
+            volume=5.00,
+            price=5000.00,
+            pickup_date=pickup_date,
+            delivery_date=pickup_date + timedelta(days=2),
+            status='pending'
+        )
+    
+    def test_expire_routes_in_chunks(self):
+        for _ in range(5):
+            self._create_route(timezone.now() - timedelta(hours=1))
+        future_route = self._create_route(timezone.now() + timedelta(days=1))
+        
+        self.assertEqual(expire_routes(chunk_size=2), 5)
+        self.assertEqual(Route.objects.filter(status='expired').count(), 5)
+        future_route.refresh_from_db()
+        self.assertEqual(future_route.status, 'pending')
+        self.assertEqual(Notification.objects.filter(notification_type='route_expired').count(), 5)
+        
+        # Повторний прохід нічого не змінює
+        self.assertEqual(expire_routes(), 0)
+        self.assertEqual(Notification.objects.filter(notification_type='route_expired').count(), 5)
+    
+    def test_expire_routes_query_count_is_constant(self):
+        for _ in range(20):
+            self._create_route(timezone.now() - timedelta(hours=1))
+        # SAVEPOINT, SELECT, UPDATE, SELECT наявних сповіщень, INSERT, SELECT вставлених, RELEASE,
+        # MIN(pickup_date) — незалежно від кількості маршрутів
+        with self.assertNumQueries(8):
+            self.assertEqual(expire_routes(), 20)
+    
+    def test_expired_notification_is_not_duplicated(self):
+        route = self._create_route(timezone.now() - timedelta(hours=1))
+        expire_routes()
+        # Маршрут повернули в pending (наприклад, вручну в адмінці) і він знову прострочився
+        Route.objects.filter(pk=route.pk).update(status='pending')
+        self.assertEqual(expire_routes(), 1)
+        self.assertEqual(Notification.objects.filter(route=route, notification_type='route_expired').count(), 1)
+    
+    def test_expired_notifications_are_pushed_after_commit_without_duplicates(self):
+        broker = RecordingBroker()
+        realtime._broker = broker
+        self.addCleanup(setattr, realtime, '_broker', None)
+        route = self._create_route(timezone.now() - timedelta(hours=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            expire_routes()
+        Route.objects.filter(pk=route.pk).update(status='pending')
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.assertEqual(expire_routes(), 1)
+            # До коміту нічого не відправлено
+            self.assertEqual(len(broker.published), 1)
+        for callback in callbacks:
+            callback()
+        # Дублікат відсічено обмеженням — повторного push немає
+        self.assertEqual(len(broker.published), 1)
+        notification = Notification.objects.get(route=route, notification_type='route_expired')
+        payload = broker.published[0][1]
+        self.assertEqual(payload['notification']['id'], notification.pk)
+        self.assertIn('Київ → Львів', payload['notification']['message'])
+    
+    def test_expire_routes_skips_when_locked(self):
+        self._create_route(timezone.now() - timedelta(hours=1))
+        with expiry_lock() as acquired:
+            self.assertTrue(acquired)
+            self.assertIsNone(expire_routes())
+        self.assertEqual(expire_routes(), 1)
+    
+    def test_file_lock_is_exclusive(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'db.sqlite3.expire_routes.lock')
+        with _file_lock(path) as acquired:
+            self.assertTrue(acquired)
+            # Другий відкритий дескриптор (як інший процес) блокування не отримує
+            with _file_lock(path) as second:
+                self.assertFalse(second)
+        with _file_lock(path) as acquired:
+            self.assertTrue(acquired)
+    
+    def test_check_expired_routes_skips_query_before_watermark(self):
+        route = self._create_route(timezone.now() + timedelta(hours=1))
+        self.assertEqual(get_expiry_watermark(), route.pickup_date)
+        with self.assertNumQueries(0):
+            self.assertEqual(check_expired_routes(), 0)
+    
+    def test_create_route_lowers_watermark(self):
+        self._create_route(timezone.now() + timedelta(days=2))
+        get_expiry_watermark()
+        self.client.login(username='company', password='testpass')
+        pickup_date = timezone.now() - timedelta(minutes=5)
+        self.client.post(reverse('create_route'), {
+            'origin_city': 'Одеса',
+            'origin_country': 'Україна',
+            'origin_lat': '46.482500',
+            'origin_lng': '30.723300',
+            'destination_city': 'Київ',
+            'destination_country': 'Україна',
+            'destination_lat': '50.450100',
+            'destination_lng': '30.523400',
+            'cargo_type': 'Пакування',
+            'weight': '10',
+            'volume': '1',
+            'price': '1000',
+            'pickup_date': timezone.localtime(pickup_date).strftime('%Y-%m-%dT%H:%M'),
+            'delivery_date': timezone.localtime(pickup_date + timedelta(days=1)).strftime('%Y-%m-%dT%H:%M'),
+        })
+        self.assertLess(get_expiry_watermark(), timezone.now())
+        self.client.get(reverse('routes_list'))
+        self.assertTrue(Route.objects.filter(origin_city='Одеса', status='expired').exists())
+
+
+class ConversationTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.company = User.objects.create_user(
+            username='company',
+            password='testpass',
+            email='company@test.com',
+            role='company',
+            company_name='Test Company'
+        )
+        self.carrier = User.objects.create_user(
+            username='carrier',
+            password='testpass',
+            email='carrier@test.com',
+            role='carrier'
+        )
+    
+    def test_start_chat_creates_conversation_without_route(self):
+        self.client.login(username='company', password='testpass')
+        response = self.client.get(reverse('start_chat_with_user', args=[self.carrier.pk]))
+        conversation = Conversation.objects.get(company=self.company, carrier=self.carrier)
+        self.assertRedirects(response, reverse('conversation_messages', args=[conversation.pk]))
+        self.assertIsNone(conversation.route)
+        self.assertFalse(Route.objects.exists())
+        
+        # Повторний виклик відкриває ту саму розмову
+        self.client.get(reverse('start_chat_with_user', args=[self.carrier.pk]))
+        self.assertEqual(Conversation.objects.count(), 1)
+    
+    def test_send_message_and_list_chats(self):
+        conversation = Conversation.objects.create(company=self.company, carrier=self.carrier)
+        self.client.login(username='company', password='testpass')
+        # Сповіщення пишеться сервісом після коміту
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                reverse('conversation_messages_send', args=[conversation.pk]),
+                {'content': 'Привіт'}
+            )
+        self.assertEqual(response.status_code, 200)
+        message = Message.objects.get(conversation=conversation)
+        self.assertEqual(message.recipient, self.carrier)
+        self.assertTrue(Notification.objects.filter(
+            user=self.carrier, notification_type='new_message', conversation=conversation
+        ).exists())
+        
+        self.client.login(username='carrier', password='testpass')
+        data = self.client.get(reverse('chats_api')).json()
+        self.assertEqual(data['total_unread'], 1)
+        self.assertEqual(data['chats'][0]['conversation_id'], conversation.pk)
+        self.assertIsNone(data['chats'][0]['route_id'])
+    
+    def test_outsider_cannot_read_conversation(self):
+        conversation = Conversation.objects.create(company=self.company, carrier=self.carrier)
+        User.objects.create_user(username='other', password='testpass', role='carrier')
+        self.client.login(username='other', password='testpass')
+        response = self.client.get(reverse('conversation_messages_api', args=[conversation.pk]))
+        self.assertEqual(response.status_code, 403)
+    
+    def test_messages_api_returns_only_messages_after_cursor(self):
+        conversation = Conversation.objects.create(company=self.company, carrier=self.carrier)
+        first = create_message(conversation, self.company, self.carrier, 'Перше')
+        second = create_message(conversation, self.company, self.carrier, 'Друге')
+        self.client.login(username='carrier', password='testpass')
+        url = reverse('conversation_messages_api', args=[conversation.pk])
+        
+        data = self.client.get(url, {'after_id': first.pk}).json()
+        self.assertEqual([msg['id'] for msg in data['messages']], [second.pk])
+        self.assertEqual(data['last_id'], second.pk)
+        self.assertNotIn('other_user', data)
+        # Водяний знак читача зсувається до останнього отриманого повідомлення
+        state = ConversationParticipant.objects.get(conversation=conversation, user=self.carrier)
+        self.assertEqual(state.last_read_id, second.pk)
+        self.assertEqual(state.unread_count, 0)
+        
+        # Нових повідомлень немає — порожня відповідь без жодного запису в базу
+        # (сесія, користувач, розмова, вибірка повідомлень)
+        with self.assertNumQueries(4):
+            response = self.client.get(url, {'after_id': second.pk})
+        self.assertEqual(response.status_code, 204)
+        
+        # Відправник бачить, що повідомлення прочитані
+        self.client.login(username='company', password='testpass')
+        data = self.client.get(url).json()
+        self.assertEqual([msg['is_read'] for msg in data['messages']], [True, True])
+
+    def test_message_notifications_are_coalesced_per_conversation(self):
+        conversation = Conversation.objects.create(company=self.company, carrier=self.carrier)
+        self.client.login(username='company', password='testpass')
+        url = reverse('conversation_messages_send', args=[conversation.pk])
+        for content in ('Перше', 'Друге', 'Третє'):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(url, {'content': content})
+
+        notification = Notification.objects.get(user=self.carrier, notification_type='new_message')
+        self.assertEqual(notification.count, 3)
+        self.assertEqual(notification.params['sender'], 'company')
+        self.assertIn('Третє', notification.rendered_message)
+        self.assertEqual(notification.rendered_title, 'Нові повідомлення: 3')
+
+        # Після прочитання наступне повідомлення починає нове сповіщення
+        notification.is_read = True
+        notification.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(url, {'content': 'Четверте'})
+        self.assertEqual(Notification.objects.filter(user=self.carrier, is_read=False).get().count, 1)
+
+    def test_message_search_is_scoped_and_highlighted(self):
+        conversation = Conversation.objects.create(company=self.company, carrier=self.carrier)
+        create_message(conversation, self.company, self.carrier, 'Вантаж <b>прибуде</b> у Київ завтра')
+        create_message(conversation, self.carrier, self.company, 'Добре, чекаємо')
+        # Чужа розмова не потрапляє у видачу
+        outsider = User.objects.create_user(username='other', password='testpass', role='carrier')
+        foreign = Conversation.objects.create(company=self.company, carrier=outsider)
+        create_message(foreign, self.company, outsider, 'Київ теж')
+
+        self.client.login(username='carrier', password='testpass')
+        data = self.client.get(reverse('messages_search_api'), {'q': 'киї'}).json()
+        self.assertEqual(len(data['results']), 1)
+        self.assertEqual(data['results'][0]['conversation_id'], conversation.pk)
+        self.assertIn('<mark>Київ</mark>', data['results'][0]['snippet'])
+        self.assertIn('&lt;b&gt;', data['results'][0]['snippet'])
+        self.assertFalse(data['has_more'])
+
+    @patch('logistics.inbox.MESSAGES_PAGE_SIZE', 2)
+    def test_messages_api_pages_history_backwards(self):
+        conversation = Conversation.objects.create(company=self.company, carrier=self.carrier)
+        sent = [create_message(conversation, self.company, self.carrier, f'Повідомлення {i}') for i in range(5)]
+        self.client.login(username='carrier', password='testpass')
+        url = reverse('conversation_messages_api', args=[conversation.pk])
+
+        # Відкриття чату повертає лише останню сторінку
+        data = self.client.get(url).json()
+        self.assertEqual([msg['id'] for msg in data['messages']], [sent[3].pk, sent[4].pk])
+        self.assertTrue(data['has_older'])
+
+        data = self.client.get(url, {'before_id': sent[3].pk}).json()
+        self.assertEqual([msg['id'] for msg in data['messages']], [sent[1].pk, sent[2].pk])
+        self.assertTrue(data['has_older'])
+
+        data = self.client.get(url, {'before_id': sent[1].pk}).json()
+        self.assertEqual([msg['id'] for msg in data['messages']], [sent[0].pk])
+        self.assertFalse(data['has_older'])
+
+    async def test_stream_sends_missed_and_published_messages(self):
+        conversation = await Conversation.objects.acreate(company=self.company, carrier=self.carrier)
+        first = await sync_to_async(create_message)(conversation, self.company, self.carrier, 'Перше')
+        await sync_to_async(self.async_client.force_login)(self.carrier)
+        response = await self.async_client.get(reverse('conversation_messages_stream', args=[conversation.pk]))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = response.streaming_content
+        
+        # Спершу приходить пропущене повідомлення
+        chunk = await anext(stream)
+        while b'event: message' not in chunk:
+            chunk = await anext(stream)
+        self.assertIn(f'id: {first.pk}'.encode(), chunk)
+        
+        # Далі — опубліковане через брокер
+        second = await sync_to_async(create_message)(conversation, self.company, self.carrier, 'Друге')
+        payload = {'id': second.pk, 'sender_id': self.company.pk}
+        get_broker().publish(conversation_channel(conversation.pk), payload)
+        chunk = await anext(stream)
+        self.assertIn(f'id: {second.pk}'.encode(), chunk)
+        await stream.aclose()
+        # Стан прочитання читача не потрапляє у спільний payload інших підписників
+        self.assertNotIn('is_read', payload)
+        
+        state = await ConversationParticipant.objects.aget(conversation=conversation, user=self.carrier)
+        self.assertEqual(state.last_read_id, second.pk)
+    
+    def test_stream_without_asgi_falls_back_to_polling(self):
+        conversation = Conversation.objects.create(company=self.company, carrier=self.carrier)
+        self.client.login(username='carrier', password='testpass')
+        response = self.client.get(reverse('conversation_messages_stream', args=[conversation.pk]))
+        self.assertEqual(response.status_code, 204)
+
+
+class RecordingBroker:
+    """Broker stub that remembers published events"""
+    
+    def __init__(self):
+        self.published = []
+    
+    def publish(self, channel, payload):
+        self.published.append((channel, payload))
+
+
+class NotificationPushTest(TestCase):
+    """Тести push-каналу сповіщень"""
+    
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='company',
+            password='testpass',
+            email='company@test.com',
+            role='company',
+            company_name='Test Company'
+        )
+        self.broker = RecordingBroker()
+        realtime._broker = self.broker
+        self.addCleanup(setattr, realtime, '_broker', None)
+        # Лічильник непрочитаних живе в кеші, а не в тестовій транзакції
+        cache.clear()
+    
+    def test_unread_counter_is_cached_and_adjusted(self):
+        self.client.login(username='company', password='testpass')
+        url = reverse('notifications_api')
+        with self.captureOnCommitCallbacks(execute=True):
+            first = Notification.objects.create(user=self.user, notification_type='new_bid', title='Нова ставка', message='Тест')
+        self.assertEqual(self.client.get(url).json()['unread_count'], 1)
+        
+        # Далі лічильник зсувається без COUNT: лише сесія, користувач, версія для ETag і список
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.objects.create(user=self.user, notification_type='new_bid', title='Нова ставка', message='Тест')
+        with self.assertNumQueries(4):
+            self.assertEqual(self.client.get(url).json()['unread_count'], 2)
+        
+        # Повторна позначка (подвійний клік) лічильник вдруге не зменшує
+        for _ in range(2):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post(reverse('mark_notification_read', args=[first.pk]), HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(self.client.get(url).json()['unread_count'], 1)
+        self.assertEqual([payload['unread_delta'] for _, payload in self.broker.published if payload['event'] == 'notification_read'], [-1])
+        response = self.client.post(reverse('mark_notification_read', args=[first.pk + 100]), HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(response.status_code, 404)
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('mark_all_notifications_read'), HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(self.client.get(url).json()['unread_count'], 0)
+    
+    def test_sync_returns_only_changed_sections(self):
+        carrier = User.objects.create_user(username='carrier', password='testpass', role='carrier')
+        conversation = Conversation.objects.create(company=self.user, carrier=carrier)
+        first = create_message(conversation, carrier, self.user, 'Привіт')
+        Notification.objects.create(user=self.user, notification_type='new_bid', title='Нова ставка', message='Тест')
+        self.client.login(username='company', password='testpass')
+        url = reverse('sync_api')
+        
+        data = self.client.get(url, {
+            'notifications': '', 'chats': '', 'conversation': conversation.pk, 'after_id': 0,
+        }).json()
+        self.assertEqual(data['notifications']['unread_count'], 1)
+        self.assertEqual([msg['id'] for msg in data['conversation']['messages']], [first.pk])
+        # Повідомлення відкритого чату вже враховані як прочитані
+        self.assertEqual(data['chats']['total_unread'], 0)
+        # Змінені вхідні приходять разом зі списком — окремий chats_api не потрібен
+        self.assertEqual([chat['conversation_id'] for chat in data['chats']['chats']], [conversation.pk])
+        self.assertEqual(data['chats']['chats'][0]['last_message'], 'Привіт')
+        
+        # З актуальними версіями та курсором відповідь не містить даних
+        data = self.client.get(url, {
+            'notifications': data['notifications']['version'],
+            'chats': data['chats']['version'],
+            'conversation': conversation.pk,
+            'after_id': first.pk,
+        }).json()
+        self.assertNotIn('notifications', data['notifications'])
+        self.assertFalse(data['chats']['changed'])
+        self.assertNotIn('chats', data['chats'])
+        self.assertEqual(data['conversation']['messages'], [])
+        # Порожня відповідь збільшує idle, а пауза відкритого чату зростає
+        self.assertEqual(data['idle'], 1)
+        self.assertEqual(data['next_poll'], 2 * polling.POLL_CHAT_DELAY)
+    
+    def test_poll_delay_backs_off_and_stretches_under_load(self):
+        with patch('logistics.polling._record_poll', return_value=1):
+            self.assertEqual(polling.next_poll_delay(0, chat_open=True), polling.POLL_CHAT_DELAY)
+            self.assertEqual(polling.next_poll_delay(20, chat_open=True), polling.POLL_CHAT_MAX_DELAY)
+            self.assertEqual(polling.next_poll_delay(1, chat_open=False), 2 * polling.POLL_IDLE_DELAY)
+        # Під навантаженням розтягуються всі інтервали, крім активного чату
+        with patch('logistics.polling._record_poll', return_value=10 ** 6):
+            self.assertEqual(polling.next_poll_delay(0, chat_open=True), polling.POLL_CHAT_DELAY)
+            self.assertEqual(
+                polling.next_poll_delay(0, chat_open=False),
+                polling.POLL_IDLE_DELAY * polling.POLL_MAX_STRETCH
+            )
+    
+    @override_settings(NOTIFICATIONS_DEFERRED=True)
+    def test_deferred_notifications_are_written_by_queue_drain(self):
+        # Потік-писар не запускаємо: пачки лише потрапляють у чергу
+        with patch('logistics.notifications._enqueue', side_effect=notifications._queue.put):
+            with self.captureOnCommitCallbacks(execute=True), notifications.collect_notifications():
+                notifications.notify(self.user, 'new_bid', carrier='Перший')
+                notifications.notify(self.user, 'new_bid', carrier='Другий')
+        self.assertFalse(Notification.objects.exists())
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(notifications.drain_queue(), 2)
+        self.assertEqual(Notification.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(notifications.unread_notifications_count(self.user.pk), 2)
+    
+    def test_created_notification_and_read_deltas_are_published(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.objects.create(user=self.user, notification_type='new_bid', title='Нова ставка', message='Тест')
+            Notification.objects.create(user=self.user, notification_type='new_bid', title='Нова ставка', message='Тест')
+        channel, payload = self.broker.published[0]
+        self.assertEqual(channel, realtime.user_channel(self.user.pk))
+        self.assertEqual(payload['event'], 'notification')
+        self.assertEqual(payload['unread_delta'], 1)
+        self.assertEqual(payload['notification']['title'], 'Нова ставка')
+        
+        self.client.login(username='company', password='testpass')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('mark_all_notifications_read'), HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(self.broker.published[-1][1], {'event': 'notification_read', 'unread_delta': -2})
+    
+    def test_rolled_back_notification_is_not_published(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                Notification.objects.create(user=self.user, notification_type='new_bid', title='Нова ставка', message='Тест')
+                raise RuntimeError
+        self.assertEqual(self.broker.published, [])
+        self.assertEqual(notifications.unread_notifications_count(self.user.pk), 0)
+    
+    def test_route_delete_resets_unread_counter(self):
+        route = Route.objects.create(
+            company=self.user, origin_city='Київ', origin_country='Україна', origin_lat=50.45, origin_lng=30.52,
+            destination_city='Львів', destination_country='Україна', destination_lat=49.84, destination_lng=24.03,
+            cargo_type='Пакування', weight=100, volume=5, price=5000,
+            pickup_date=timezone.now() + timedelta(days=1), delivery_date=timezone.now() + timedelta(days=3)
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.objects.create(user=self.user, notification_type='new_bid', route=route, params={'carrier': 'c'})
+        self.assertEqual(notifications.unread_notifications_count(self.user.pk), 1)
+        
+        self.client.login(username='company', password='testpass')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('delete_route', args=[route.pk]))
+        self.assertFalse(Notification.objects.exists())
+        self.assertEqual(notifications.unread_notifications_count(self.user.pk), 0)
+    
+    async def test_stream_starts_with_counters_and_relays_events(self):
+        realtime._broker = None
+        await Notification.objects.acreate(user=self.user, notification_type='new_bid', title='Нова ставка', message='Тест')
+        await sync_to_async(self.async_client.force_login)(self.user)
+        response = await self.async_client.get(reverse('notifications_stream'))
+        stream = response.streaming_content
+        
+        chunk = await anext(stream)
+        while b'event: sync' not in chunk:
+            chunk = await anext(stream)
+        self.assertIn(b'"notifications_unread": 1', chunk)
+        
+        realtime.get_broker().publish(realtime.user_channel(self.user.pk), {'event': 'notification_read', 'unread_delta': -1})
+        chunk = await anext(stream)
+        self.assertIn(b'event: notification_read', chunk)
+        await stream.aclose()
+
+
+class NotificationRetentionTest(TestCase):
+    """Тести очищення старих сповіщень"""
+    
+    def test_prune_removes_only_expired_read_notifications(self):
+        user = User.objects.create_user(username='company', password='testpass', role='company')
+        def make(notification_type, is_read, days_ago):
+            notification = Notification.objects.create(
+                user=user, notification_type=notification_type, title='Тест', message='Тест', is_read=is_read
+            )
+            Notification.objects.filter(pk=notification.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+            return notification
+        
+        expired = make('tracking_updated', True, 20)
+        kept = [
+            make('tracking_updated', True, 1),     # ще в межах строку
+            make('tracking_updated', False, 20),   # непрочитані не чіпаємо
+            make('new_bid', True, 20),             # строк за замовчуванням довший
+        ]
+        
+        archive = io.StringIO()
+        deleted = prune_notifications(chunk_size=1, archive=archive)
+        self.assertEqual(deleted, {'tracking_updated': 1})
+        self.assertFalse(Notification.objects.filter(pk=expired.pk).exists())
+        self.assertEqual(Notification.objects.count(), len(kept))
+        self.assertEqual(json.loads(archive.getvalue())['id'], expired.pk)
+
+
+class InboxTest(TestCase):
+    """Тести списку чатів (вхідних)"""
+    
+    def setUp(self):
+        self.company = User.objects.create_user(
+            username='company',
+            password='testpass',
+            email='company@test.com',
+            role='company',
+            company_name='Test Company'
+        )
+        self.carriers = [
+            User.objects.create_user(username=f'carrier{i}', password='testpass', role='carrier')
+            for i in range(3)
+        ]
+        self.conversations = [
+            Conversation.objects.create(company=self.company, carrier=carrier)
+            for carrier in self.carriers
+        ]
+        for conversation in self.conversations[:2]:
+            create_message(conversation, conversation.carrier, self.company, 'Привіт')
+        create_message(self.conversations[0], self.carriers[0], self.company, 'Останнє')
+        self.client.login(username='company', password='testpass')
+    
+    def test_chats_api_uses_constant_number_of_queries(self):
+        # Сесія, користувач, версія для ETag, COUNT сторінок, рядки сторінки, сума лічильників учасника
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse('chats_api'))
+        data = response.json()
+        self.assertEqual(data['total_unread'], 3)
+        # Спершу розмова з найсвіжішим повідомленням, розмова без повідомлень — остання
+        self.assertEqual(
+            [chat['conversation_id'] for chat in data['chats']],
+            [self.conversations[0].pk, self.conversations[1].pk, self.conversations[2].pk]
+        )
+        self.assertEqual(data['chats'][0]['last_message'], 'Останнє')
+        self.assertEqual(data['chats'][0]['unread_count'], 2)
+        self.assertIsNone(data['chats'][2]['last_message'])
+    
+        # Нічого не змінилося — 304 без рендерингу; нове повідомлення змінює версію
+        with self.assertNumQueries(3):
+            cached = self.client.get(reverse('chats_api'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        create_message(self.conversations[2], self.carriers[2], self.company, 'Нове')
+        fresh = self.client.get(reverse('chats_api'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(fresh.status_code, 200)
+    
+    @patch('logistics.views.CHATS_PAGE_SIZE', 2)
+    def test_chats_are_paginated(self):
+        first = self.client.get(reverse('chats_api')).json()
+        second = self.client.get(reverse('chats_api'), {'page': 2}).json()
+        self.assertTrue(first['has_next'])
+        self.assertEqual(len(first['chats']), 2)
+        self.assertFalse(second['has_next'])
+        self.assertEqual(second['chats'][0]['conversation_id'], self.conversations[2].pk)
+        
+        response = self.client.get(reverse('chats_list'))
+        self.assertContains(response, 'carrier0')
+        self.assertNotContains(response, 'carrier2')
+    
+    def test_counters_follow_sent_and_read_messages(self):
+        state = ConversationParticipant.objects.get(conversation=self.conversations[0], user=self.company)
+        self.assertEqual(state.unread_count, 2)
+        self.assertEqual(state.last_message.content, 'Останнє')
+        
+        # Відкриття розмови обнуляє лічильник отримувача
+        self.client.get(reverse('conversation_messages', args=[self.conversations[0].pk]))
+        state.refresh_from_db()
+        self.assertEqual(state.unread_count, 0)
+        self.assertEqual(self.client.get(reverse('chats_api')).json()['total_unread'], 1)
+        
+        # Відправник свого повідомлення непрочитаним не бачить
+        self.client.post(reverse('conversation_messages_send', args=[self.conversations[0].pk]), {'content': 'Відповідь'})
+        state.refresh_from_db()
+        self.assertEqual(state.unread_count, 0)
+        carrier_state = ConversationParticipant.objects.get(conversation=self.conversations[0], user=self.carriers[0])
+        self.assertEqual(carrier_state.unread_count, 1)
+        self.assertEqual(carrier_state.last_message.content, 'Відповідь')
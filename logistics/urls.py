@@ -23,9 +23,11 @@ urlpatterns = [
     
     # Повідомлення/чат
     path('routes/<int:pk>/messages/', views.route_messages, name='route_messages'), # чат по маршруту
-    path('routes/<int:pk>/messages/api/', views.route_messages_api, name='route_messages_api'), # Кінцева точка AJAX для чату
-    path('routes/<int:pk>/messages/send/', views.route_messages_send, name='route_messages_send'), # відправлення повідомлень
     path('chats/', views.chats_list, name='chats_list'),                      # усі чати
+    path('chats/<int:pk>/', views.conversation_messages, name='conversation_messages'), # чат розмови
+    path('chats/<int:pk>/messages/api/', views.conversation_messages_api, name='conversation_messages_api'), # Кінцева точка AJAX для чату
+    path('chats/<int:pk>/messages/send/', views.conversation_messages_send, name='conversation_messages_send'), # відправлення повідомлень
+    path('chats/<int:pk>/messages/stream/', views.conversation_messages_stream, name='conversation_messages_stream'), # SSE-потік нових повідомлень
     
     # Профілі користувачів
     path('profile/<int:user_id>/', views.user_profile, name='user_profile'),   # перегляд профілю
@@ -33,7 +35,11 @@ urlpatterns = [
     
     # Ендпоїнти AJAX
     path('api/notifications/', views.notifications_api, name='notifications_api'), # отримати сповіщення
+    path('api/notifications/stream/', views.notifications_stream, name='notifications_stream'), # SSE-потік сповіщень
     path('api/chats/', views.chats_api, name='chats_api'),                    # список чатів
+    path('api/sync/', views.sync_api, name='sync_api'),                       # зведене опитування (без SSE)
+    path('api/messages/search/', views.messages_search_api, name='messages_search_api'), # пошук по повідомленнях
+    path('api/cities/', views.cities_api, name='cities_api'),                 # автодоповнення міст
     path('api/history/', views.history_api, name='history_api'),              # історія
     
     # Управління сповіщеннями
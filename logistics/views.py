@@ -1,152 +1,145 @@
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse, HttpResponse
+from django.conf import settings
+from django.http import JsonResponse, HttpResponse, Http404, StreamingHttpResponse
+from django.core.handlers.asgi import ASGIRequest
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.core.paginator import Paginator
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from django.db import transaction
+from django.db.models import Count, F, FilteredRelation, Max, PositiveIntegerField, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.template.loader import render_to_string
-from .models import Route, Bid, Tracking, Message, Notification, Rating
+from .models import Route, Bid, Tracking, Conversation, ConversationParticipant, Message, Notification, Rating
 from .forms import RouteForm, BidForm, TrackingUpdateForm, MessageForm, RatingForm
-
-
-# Перевірка та позначення прострочених маршрутів
-# Маршрут стає простроченим, якщо до pickup_date не прийнято жодної ставки
-def check_expired_routes():
-    """Check and mark expired routes"""
-    now = timezone.now()
-    
-    # Шукаємо маршрути зі статусом pending, без перевізника та з минулою датою забору
-    # Виключаємо тимчасові маршрути для чату
-    expired_routes = Route.objects.filter(
-        status='pending',
-        carrier__isnull=True,
-        pickup_date__lt=now
-    ).exclude(origin_city='Чат').exclude(destination_city='Чат')
-    
-    expired_count = 0
-    for route in expired_routes:
-        # Переводимо маршрут у статус expired
-        route.status = 'expired'
-        route.save()
-        
-        # Перевіряємо, чи вже існує повідомлення, щоб не створювати дублікат
-        existing_notification = Notification.objects.filter(
-            user=route.company,
-            notification_type='route_expired',
-            route=route
-        ).exists()
-        
-        # Створюємо нове сповіщення лише якщо його ще немає
-        if not existing_notification:
-            # Переводимо дату в локальний час (Europe/Kyiv)
-            pickup_date_local = timezone.localtime(route.pickup_date) if timezone.is_aware(route.pickup_date) else route.pickup_date
-            Notification.objects.create(
-                user=route.company,
-                notification_type='route_expired',
-                title='Маршрут просрочений',
-                message=f'Маршрут {route.origin_city} → {route.destination_city} просрочений. Ніхто не прийняв ставку до часу забору ({pickup_date_local.strftime("%d.%m.%Y %H:%M")}).',
-                route=route
-            )
-            expired_count += 1
-    
-    return expired_count
+from .expiry import check_expired_routes, lower_expiry_watermark, discard_expiry_deadline
+from .notifications import (
+    adjust_unread_notifications, collect_notifications, invalidate_unread_notifications, notify,
+    unread_notifications_count,
+)
+from .inbox import create_message, mark_read, message_history, notify_new_message, total_unread_messages, with_read_state
+from .cities import CITY_SUGGESTIONS_LIMIT, filter_by_origin_city, origin_cities, suggest_cities
+from .feed import pending_routes, route_json, route_rows
+from .search import search_messages
+from .polling import next_poll_delay
+from .realtime import (
+    SSE_HEARTBEAT_INTERVAL, SSE_STREAM_LIFETIME, SSE_RETRY_MS,
+    conversation_channel, user_channel, get_broker, publish_on_commit, publish_user_event,
+    notification_data, sse_event, sse_response, user_event_stream,
+)
 
 
 # Список маршрутів залежно від ролі: компанії бачать свої, перевізники — доступні
 @login_required
 def routes_list(request):
     """Routes list view"""
-    # Перед показом оновлюємо прострочені маршрути
+    # Основну роботу робить воркер (manage.py expire_routes);
+    # тут лише звіряємо кешовану найближчу дату забору з поточним часом
     check_expired_routes()
     
-    # Витягуємо маршрути відповідно до ролі
-    # Виключаємо тимчасові маршрути для чату (де origin_city='Чат' або destination_city='Чат')
-    if request.user.role == 'company':
-        # Компанія бачить усі власні маршрути (виключаємо чати)
-        routes = Route.objects.filter(company=request.user).exclude(origin_city='Чат').exclude(destination_city='Чат').order_by('-created_at')
-    elif request.user.role == 'carrier':
-        # Перевізники бачать лише pending-маршрути (виключаємо чати)
-        routes = Route.objects.filter(status='pending').exclude(origin_city='Чат').exclude(destination_city='Чат').order_by('-created_at')
-    else:
-        # Інші ролі не мають доступу
-        routes = Route.objects.none()
-    
-    # Фільтр за містом відправлення (із пошуку чи дропдауну)
+    # Фільтр за містом відправлення (із пошуку чи дропдауну) і за статусами (можна обрати кілька)
     origin_city_filter = request.GET.get('origin_city', '')
     search_city = request.GET.get('search_city', '')
     city_filter = origin_city_filter or search_city
-    if city_filter:
-        # Пошук без урахування регістру
-        routes = routes.filter(origin_city__icontains=city_filter)
-    
-    # Фільтр за статусами (можна обрати кілька)
     status_filter = request.GET.getlist('status')
-    if status_filter:
-        routes = routes.filter(status__in=status_filter)
     
-    # Формуємо список унікальних міст для фільтра (виключаємо чати)
-    origin_cities = Route.objects.exclude(origin_city='Чат').exclude(destination_city='Чат').values_list('origin_city', flat=True).distinct().order_by('origin_city')
+    # Курсор нескінченного прокручування — (created_at, id) найстарішого вже показаного маршруту.
+    # Час передає клієнт, тож курсор працює, навіть якщо маршрут тим часом видалили
+    try:
+        before_id = int(request.GET.get('before_id') or 0)
+        before_time = _parse_cursor_time(request.GET.get('before_time'))
+    except ValueError:
+        if request.GET.get('format') == 'json':
+            return JsonResponse({'error': 'Invalid cursor'}, status=400)
+        # Зіпсоване посилання на HTML-сторінку — показуємо першу сторінку
+        before_id, before_time = 0, None
     
-    # Обслуговуємо AJAX-запит для списку міст (автозаповнення)
+    # Витягуємо маршрути відповідно до ролі
+    if request.user.role == 'carrier':
+        # Перевізники бачать лише pending-маршрути — спільна кешована стрічка
+        routes = pending_routes(city_filter, status_filter, before_id, before_time)
+    else:
+        if request.user.role == 'company':
+            # Компанія бачить усі власні маршрути
+            routes = Route.objects.filter(company=request.user)
+        else:
+            # Інші ролі не мають доступу
+            routes = Route.objects.none()
+        if city_filter:
+            # Префікс або схожа назва за нормалізованим ключем (індекс замість icontains)
+            routes = filter_by_origin_city(routes, city_filter)
+        if status_filter:
+            routes = routes.filter(status__in=status_filter)
+        routes = route_rows(_routes_page(routes, before_id, before_time))
+    
+    # Список унікальних міст для фільтра — з кешованого довідника
+    cities = origin_cities()
+    
+    # Обслуговуємо AJAX-запит для списку міст (дропдаун фільтра)
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest' and 'get_cities' in request.GET:
-        return JsonResponse({'cities': list(origin_cities)})
+        return JsonResponse({'cities': cities})
     
     # Обслуговуємо AJAX-запит у форматі JSON (динамічне завантаження)
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest' and 'format' in request.GET and request.GET.get('format') == 'json':
-        routes_data = []
-        for route in routes:
-            # Дати переводимо в локальний час (Europe/Kyiv)
-            pickup_date_local = None
-            delivery_date_local = None
-            if route.pickup_date:
-                # Перевіряємо, чи містить дата часовий пояс
-                if timezone.is_aware(route.pickup_date):
-                    # Перетворюємо з UTC у локальний
-                    pickup_date_local = timezone.localtime(route.pickup_date)
-                else:
-                    # Якщо дата без TZ — залишаємо як є
-                    pickup_date_local = route.pickup_date
-            if route.delivery_date:
-                if timezone.is_aware(route.delivery_date):
-                    delivery_date_local = timezone.localtime(route.delivery_date)
-                else:
-                    delivery_date_local = route.delivery_date
-            
-            # Формуємо словник даних маршруту для JSON
-            route_data = {
-                'id': route.id,
-                'origin_city': route.origin_city,
-                'destination_city': route.destination_city,
-                'cargo_type': route.cargo_type,
-                'weight': str(route.weight),  # у JSON відправляємо рядком
-                'price': str(route.price),    # аналогічно для ціни
-                'status': route.status,
-                'pickup_date': pickup_date_local.strftime('%d.%m.%Y %H:%M') if pickup_date_local else None,
-                'delivery_date': delivery_date_local.strftime('%d.%m.%Y %H:%M') if delivery_date_local else None,
-                'company_id': route.company.pk if route.company else None,
-                'company_name': route.company.company_name if route.company and route.company.company_name else route.company.username if route.company else None,
-            }
-            
-            # Якщо є призначений перевізник — додаємо його дані
-            if route.carrier:
-                route_data['carrier_id'] = route.carrier.pk
-                route_data['carrier_name'] = route.carrier.username
-                # Якщо є рейтинг перевізника — додаємо
-                try:
-                    if route.carrier.carrier_profile and route.carrier.carrier_profile.rating > 0:
-                        route_data['carrier_rating'] = float(route.carrier.carrier_profile.rating)
-                except:
-                    pass  # у разі помилки просто пропускаємо
-            
-            routes_data.append(route_data)
-        return JsonResponse({'routes': routes_data})
+        return StreamingHttpResponse(_routes_feed(routes), content_type='application/json')
     
+    # Зайвий рядок лише сигналізує, що є наступна сторінка
+    page = list(routes)
+    has_more = len(page) > settings.ROUTES_PAGE_SIZE
+    page = page[:settings.ROUTES_PAGE_SIZE]
     return render(request, 'logistics/routes_list.html', {
-        'routes': routes,
+        'routes': page,
+        'has_more': has_more,
+        'next_before_id': page[-1]['id'] if has_more else None,
+        'next_before_time': page[-1]['created_at'].isoformat() if has_more else None,
         'origin_city_filter': origin_city_filter,
-        'origin_cities': origin_cities,
+        'origin_cities': cities,
     })
 
 
+def _parse_cursor_time(value):
+    """Parse the before_time cursor (ISO 8601 with offset); raises ValueError if malformed"""
+    if not value:
+        return None
+    cursor_time = parse_datetime(value)
+    if cursor_time is None or timezone.is_naive(cursor_time):
+        raise ValueError(value)
+    return cursor_time
+
+
+def _routes_page(routes, before_id=None, before_time=None):
+    """Order routes newest first, after the (before_time, before_id) cursor, sliced to one page plus a has-more row"""
+    if before_id:
+        # Без часу (старі посилання) беремо його підзапитом — без окремого звернення до бази
+        cursor_time = before_time or Subquery(Route.objects.filter(pk=before_id).values('created_at')[:1])
+        routes = routes.filter(Q(created_at__lt=cursor_time) | Q(created_at=cursor_time, pk__lt=before_id))
+    return routes.order_by('-created_at', '-pk')[:settings.ROUTES_PAGE_SIZE + 1]
+
+
+def _routes_feed(rows):
+    """Stream the page as JSON: rows go out one at a time, dates are ISO 8601"""
+    yield '{"routes": ['
+    last_row = None
+    for index, row in enumerate(rows):
+        if index == settings.ROUTES_PAGE_SIZE:
+            # Рядок понад сторінку — отже, є наступна
+            yield (
+                f'], "has_more": true, "next_before_id": {last_row["id"]}, '
+                f'"next_before_time": "{last_row["created_at"].isoformat()}"}}'
+            )
+            return
+        yield (',' if index else '') + json.dumps(route_json(row), ensure_ascii=False)
+        last_row = row
+    yield '], "has_more": false, "next_before_id": null, "next_before_time": null}'
+
+
 # Створення маршруту: доступно лише компаніям
 @login_required
 def create_route(request):
@@ -167,6 +160,7 @@ def create_route(request):
             route = form.save(commit=False)
             route.company = request.user  # власник маршруту — поточна компанія
             route.save()
+            lower_expiry_watermark(route.pickup_date)
             
             # Створюємо Tracking із початковими координатами
             Tracking.objects.create(
@@ -222,6 +216,8 @@ def edit_route(request, pk):
         if form.is_valid():
             # Зберігаємо маршрут
             route = form.save()
+            if route.status == 'pending':
+                lower_expiry_watermark(route.pickup_date)
             
             # Оновлюємо Tracking, якщо змінилися координати відправлення
             tracking = Tracking.objects.filter(route=route).first()
@@ -276,8 +272,16 @@ def delete_route(request, pk):
         # Зберігаємо інформацію про маршрут для повідомлення
         route_info = f"{route.origin_city} → {route.destination_city}"
         
-        # Видаляємо маршрут (CASCADE видалить пов'язані об'єкти)
-        route.delete()
+        # Видаляємо маршрут (CASCADE видалить пов'язані об'єкти).
+        # Сповіщення маршруту й його чату видаляються пакетом без сигналів,
+        # тож лічильники їхніх власників скидаємо після коміту
+        with transaction.atomic():
+            affected_users = set(
+                Notification.objects.filter(Q(route=route) | Q(conversation__route=route), is_read=False)
+                .values_list('user_id', flat=True)
+            )
+            route.delete()
+            invalidate_unread_notifications(*affected_users)
         
         messages.success(request, f'Маршрут {route_info} успішно видалено!')
         
@@ -354,11 +358,10 @@ def route_detail(request, pk):
     # Кількість непрочитаних повідомлень по маршруту
     unread_messages_count = 0
     if route.carrier:
-        unread_messages_count = Message.objects.filter(
-            route=route, 
-            recipient=request.user,  # адресовані поточному користувачу
-            is_read=False  # лише непрочитані
-        ).count()
+        unread_messages_count = ConversationParticipant.objects.filter(
+            conversation__route=route,
+            user=request.user
+        ).values_list('unread_count', flat=True).first() or 0
     
     # Перевіряємо чи компанія може поставити оцінку перевізнику (тільки для доставлених маршрутів)
     can_rate = False
@@ -424,6 +427,7 @@ def route_detail(request, pk):
 
 # Створення ставки: лише для перевізників, підтримує звичайні POST і AJAX
 @login_required
+@collect_notifications()
 def create_bid(request, pk):
     """Create bid on route"""
     # Перевіряємо, що користувач — перевізник
@@ -465,12 +469,11 @@ def create_bid(request, pk):
             bid.save()
             
             # Повідомляємо компанію про нову ставку
-            Notification.objects.create(
+            notify(
                 user=route.company,
                 notification_type='new_bid',
-                title='Нова ставка',
-                message=f'Перевізник {request.user.username} зробив ставку на маршрут {route.origin_city} → {route.destination_city}',
-                route=route
+                route=route,
+                carrier=request.user.username
             )
             
             # Формуємо відповідь залежно від типу запиту
@@ -507,6 +510,7 @@ def create_bid(request, pk):
 
 # Прийняття ставки перевізника (доступно лише компаніям)
 @login_required
+@collect_notifications()
 def accept_bid(request, bid_id):
     """Accept bid (only for companies)"""
     # Перевіряємо роль
@@ -531,6 +535,7 @@ def accept_bid(request, bid_id):
     bid.route.status = 'in_transit'  # маршрут у дорозі
     bid.route.price = bid.proposed_price  # ціна = ставка
     bid.route.save()
+    discard_expiry_deadline(bid.route.pickup_date)
     
     # За потреби створюємо запис Tracking
     Tracking.objects.get_or_create(route=bid.route, defaults={
@@ -541,20 +546,17 @@ def accept_bid(request, bid_id):
     })
     
     # Повідомляємо перевізника про прийняту ставку
-    Notification.objects.create(
+    notify(
         user=bid.carrier,
         notification_type='bid_accepted',
-        title='Вашу ставку прийнято!',
-        message=f'Компанія {request.user.username} прийняла вашу ставку на маршрут {bid.route.origin_city} → {bid.route.destination_city}',
-        route=bid.route
+        route=bid.route,
+        company=request.user.username
     )
     
     # Додаткове повідомлення про призначення маршруту
-    Notification.objects.create(
+    notify(
         user=bid.carrier,
         notification_type='route_assigned',
-        title='Вам призначено маршрут',
-        message=f'Вам призначено маршрут {bid.route.origin_city} → {bid.route.destination_city}',
         route=bid.route
     )
     
@@ -567,6 +569,7 @@ def accept_bid(request, bid_id):
 
 # Завершення маршруту (доступно компанії або закріпленому перевізнику)
 @login_required
+@collect_notifications()
 def complete_route(request, pk):
     """Complete route"""
     route = get_object_or_404(Route, pk=pk)
@@ -587,18 +590,14 @@ def complete_route(request, pk):
     
     # Створюємо сповіщення про завершення
     if route.carrier:
-        Notification.objects.create(
+        notify(
             user=route.carrier,
             notification_type='route_completed',
-            title='Маршрут завершено',
-            message=f'Маршрут {route.origin_city} → {route.destination_city} успішно завершено',
             route=route
         )
-    Notification.objects.create(
+    notify(
         user=route.company,
         notification_type='route_completed',
-        title='Маршрут завершено',
-        message=f'Маршрут {route.origin_city} → {route.destination_city} успішно завершено',
         route=route
     )
     
@@ -751,6 +750,7 @@ def tracking_view(request, pk):
 
 
 @login_required
+@collect_notifications()
 def update_tracking(request, pk):
     """Оновлення прогресу доставки"""
     route = get_object_or_404(Route, pk=pk)
@@ -812,12 +812,11 @@ def update_tracking(request, pk):
             
             # Створюємо сповіщення для компанії про оновлення відстеження
             if route.company:
-                Notification.objects.create(
+                notify(
                     user=route.company,
                     notification_type='tracking_updated',
-                    title='Оновлено відстеження',
-                    message=f'Прогрес доставки оновлено до {tracking.progress_percent}% для маршруту {route.origin_city} → {route.destination_city}',
-                    route=route
+                    route=route,
+                    progress=tracking.progress_percent
                 )
             
             messages.success(request, f'Прогрес оновлено до {tracking.progress_percent}%')
@@ -834,70 +833,78 @@ def update_tracking(request, pk):
     return redirect('tracking', pk=route.pk)
 
 
-@login_required
-def route_messages(request, pk):
-    """Месенджер для маршруту"""
-    route = get_object_or_404(Route, pk=pk)
-    
-    # Перевірка доступу
-    if route.company != request.user and (not route.carrier or route.carrier != request.user):
-        messages.error(request, 'У вас немає доступу до цього маршруту')
-        return redirect('home')
-    
-    # Визначаємо співрозмовника
-    if request.user == route.company:
-        other_user = route.carrier
-    elif request.user == route.carrier:
-        other_user = route.company
-    else:
-        other_user = None
-    
-    # Якщо перевізник ще не призначений, не показуємо месенджер
-    if not route.carrier:
-        messages.info(request, 'Месенджер стане доступним після призначення перевізника')
-        return redirect('route_detail', pk=route.pk)
-    
-    if not other_user:
-        messages.error(request, 'Неможливо визначити співрозмовника')
-        return redirect('route_detail', pk=route.pk)
+# Розмова по маршруту: створюємо її при першому зверненні
+def _get_route_conversation(route):
+    conversation, _ = Conversation.objects.get_or_create(
+        route=route,
+        defaults={'company': route.company, 'carrier': route.carrier}
+    )
+    return conversation
+
+
+# JSON-представлення повідомлення (API та SSE-потік)
+def _message_data(msg):
+    return {
+        'id': msg.id,
+        'sender': msg.sender.username,
+        'sender_id': msg.sender_id,
+        'content': msg.content,
+        'created_at': msg.created_at.strftime('%d.%m.%Y %H:%M'),
+        # Нове повідомлення ще не анотоване with_read_state — воно непрочитане
+        'is_read': getattr(msg, 'is_read', False),
+    }
+
+
+# Повідомляємо відкриті SSE-потоки розмови та отримувача про нове повідомлення
+def _publish_message(message):
+    publish_on_commit(conversation_channel(message.conversation_id), _message_data(message))
+    publish_user_event(message.recipient_id, 'chat', conversation_id=message.conversation_id, unread_delta=1)
+
+
+# Прочитання: зсуваємо водяний знак учасника, інші вкладки зменшують бейдж чатів
+def _mark_read(user_id, conversation_id, message_id=None):
+    read_count = mark_read(conversation_id, user_id, message_id)
+    if read_count:
+        publish_user_event(user_id, 'chat', conversation_id=conversation_id, unread_delta=-read_count)
+
+
+# Спільна логіка сторінки месенджера для маршруту та прямого чату
+@collect_notifications()
+def _conversation_page(request, conversation):
+    other_user = conversation.other_participant(request.user)
     
-    # Отримуємо повідомлення для цього маршруту
-    messages_list = Message.objects.filter(route=route).order_by('created_at')
+    # Остання сторінка історії; старіші догружаються через API за курсором
+    messages_list, has_older = message_history(conversation)
     
-    # Позначаємо повідомлення як прочитані
-    Message.objects.filter(route=route, recipient=request.user, is_read=False).update(is_read=True)
+    # Позначаємо розмову прочитаною до останнього повідомлення
+    _mark_read(request.user.id, conversation.id)
     
     # Обробка форми відправки повідомлення
     if request.method == 'POST':
         form = MessageForm(request.POST)
         if form.is_valid():
-            message = form.save(commit=False)
-            message.route = route
-            message.sender = request.user
-            message.recipient = other_user
-            message.save()
+            message = create_message(conversation, request.user, other_user, form.cleaned_data['content'])
+            _publish_message(message)
             
-            # Створюємо сповіщення для отримувача
-            Notification.objects.create(
-                user=other_user,
-                notification_type='new_message',
-                title='Нове повідомлення',
-                message=f'Від {request.user.username}: {message.content[:50]}...',
-                route=route
-            )
+            # Сповіщення отримувача (згортається з непрочитаним по цій розмові)
+            notify_new_message(message)
             
             messages.success(request, 'Повідомлення відправлено!')
-            return redirect('route_messages', pk=route.pk)
+            return redirect(request.path)
     else:
         form = MessageForm()
     
-    # Рахуємо непрочитані повідомлення
-    unread_count = Message.objects.filter(route=route, recipient=request.user, is_read=False).count()
+    # Непрочитані повідомлення з лічильника учасника
+    unread_count = ConversationParticipant.objects.filter(
+        conversation=conversation, user=request.user
+    ).values_list('unread_count', flat=True).first() or 0
     
     context = {
-        'route': route,
+        'conversation': conversation,
+        'route': conversation.route,
         'other_user': other_user,
         'messages_list': messages_list,
+        'has_older': has_older,
         'form': form,
         'unread_count': unread_count,
     }
@@ -905,36 +912,117 @@ def route_messages(request, pk):
 
 
 @login_required
-def route_messages_api(request, pk):
-    """API для отримання повідомлень маршруту (AJAX/HTMX)"""
+def route_messages(request, pk):
+    """Месенджер для маршруту"""
     route = get_object_or_404(Route, pk=pk)
     
     # Перевірка доступу
     if route.company != request.user and (not route.carrier or route.carrier != request.user):
+        messages.error(request, 'У вас немає доступу до цього маршруту')
+        return redirect('home')
+    
+    # Якщо перевізник ще не призначений, не показуємо месенджер
+    if not route.carrier:
+        messages.info(request, 'Месенджер стане доступним після призначення перевізника')
+        return redirect('route_detail', pk=route.pk)
+    
+    return _conversation_page(request, _get_route_conversation(route))
+
+
+@login_required
+def conversation_messages(request, pk):
+    """Месенджер для розмови (прямий чат або чат маршруту)"""
+    conversation = get_object_or_404(Conversation.objects.select_related('company', 'carrier', 'route'), pk=pk)
+    
+    # Перевірка доступу
+    if not conversation.has_participant(request.user):
+        messages.error(request, 'У вас немає доступу до цього чату')
+        return redirect('home')
+    
+    return _conversation_page(request, conversation)
+
+
+# Умовний GET для опитування: ETag — дешева версія даних, браузер перевіряє її щоразу (no-cache),
+# а при збігу отримує 304 без рендерингу шаблонів і серіалізації
+def _conditional(etag_func):
+    def decorator(view):
+        return cache_control(private=True, no_cache=True)(condition(etag_func=etag_func)(view))
+    return decorator
+
+
+def _version_etag(request, *parts):
+    # HTMX і JSON — різні тіла за тією ж адресою
+    kind = 'htmx' if request.headers.get('HX-Request') == 'true' else 'json'
+    return ':'.join(str(part) for part in (kind, *parts))
+
+
+# Версія розмови: останнє повідомлення та водяний знак співрозмовника (галочки прочитання)
+def _conversation_messages_etag(request, pk):
+    # Опитування за курсором і так отримує 204 без тіла
+    if request.GET.get('after_id'):
+        return None
+    states = dict(
+        (user_id, (last_message_id, last_read_id))
+        for user_id, last_message_id, last_read_id in ConversationParticipant.objects.filter(
+            conversation_id=pk
+        ).values_list('user_id', 'last_message_id', 'last_read_id')
+    )
+    # Сторонній користувач отримує 403 від самого view
+    if request.user.pk not in states:
+        return None
+    other_read = max([read for user_id, (_, read) in states.items() if user_id != request.user.pk], default=0)
+    return _version_etag(request, states[request.user.pk][0], other_read)
+
+
+@login_required
+@_conditional(_conversation_messages_etag)
+def conversation_messages_api(request, pk):
+    """API для отримання повідомлень розмови (AJAX/HTMX)"""
+    conversation = get_object_or_404(Conversation.objects.select_related('company', 'carrier', 'route'), pk=pk)
+    
+    # Перевірка доступу
+    if not conversation.has_participant(request.user):
         if request.headers.get('HX-Request'):
             return HttpResponse('<div class="alert alert-danger">Access denied</div>', status=403)
         return JsonResponse({'error': 'Access denied'}, status=403)
     
-    # Визначаємо співрозмовника
-    if request.user == route.company:
-        other_user = route.carrier
-    elif request.user == route.carrier:
-        other_user = route.company
+    # Курсори: after_id — останнє побачене повідомлення, before_id — найстаріше завантажене
+    try:
+        after_id = int(request.GET.get('after_id') or 0)
+        before_id = int(request.GET.get('before_id') or 0)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid cursor'}, status=400)
+    
+    # Старіші повідомлення сторінкою перед курсором; водяний знак не змінюється
+    if before_id:
+        messages_list, has_older = message_history(conversation, before_id)
+        return JsonResponse({
+            'messages': [_message_data(msg) for msg in messages_list],
+            'has_older': has_older,
+        })
+    
+    if after_id:
+        # Отримуємо лише повідомлення, новіші за курсор (pk зростає разом із created_at)
+        messages_list = list(
+            with_read_state(Message.objects.filter(conversation=conversation, pk__gt=after_id))
+            .select_related('sender')
+            .order_by('pk')
+        )
     else:
-        if request.headers.get('HX-Request'):
-            return HttpResponse('<div class="alert alert-danger">Invalid user</div>', status=403)
-        return JsonResponse({'error': 'Invalid user'}, status=403)
+        # Перше завантаження — лише остання сторінка історії
+        messages_list, has_older = message_history(conversation)
     
-    if not route.carrier or not other_user:
-        if request.headers.get('HX-Request'):
-            return HttpResponse('<div class="alert alert-danger">Invalid route</div>', status=404)
-        return JsonResponse({'error': 'Invalid route'}, status=404)
+    # Нічого нового — порожня відповідь без серіалізації історії
+    if after_id and not messages_list:
+        return HttpResponse(status=204)
     
-    # Отримуємо повідомлення
-    messages_list = Message.objects.filter(route=route).order_by('created_at')
+    # Зсуваємо водяний знак до останнього отриманого повідомлення (один рядок учасника)
+    if messages_list:
+        _mark_read(request.user.id, conversation.id, messages_list[-1].pk)
     
-    # Позначаємо як прочитані
-    Message.objects.filter(route=route, recipient=request.user, is_read=False).update(is_read=True)
+    # Визначаємо співрозмовника
+    other_user = conversation.other_participant(request.user)
+    route = conversation.route
     
     # Перевіряємо, чи це HTMX-запит
     is_htmx = request.headers.get('HX-Request') == 'true'
@@ -944,48 +1032,114 @@ def route_messages_api(request, pk):
         html = render_to_string('logistics/messages_partial.html', {
             'messages': messages_list,
             'other_user': other_user,
+            'conversation': conversation,
             'route': route,
             'current_user_id': request.user.id,
         }, request=request)
         return HttpResponse(html)
     
     # Інакше повертаємо JSON для AJAX
-    messages_data = [{
-        'id': msg.id,
-        'sender': msg.sender.username,
-        'sender_id': msg.sender.id,
-        'content': msg.content,
-        'created_at': msg.created_at.strftime('%d.%m.%Y %H:%M'),
-        'is_read': msg.is_read,
-    } for msg in messages_list]
+    messages_data = [_message_data(msg) for msg in messages_list]
     
-    return JsonResponse({
+    data = {
         'messages': messages_data,
-        'other_user': other_user.username,
-        'route_origin': route.origin_city,
-        'route_destination': route.destination_city,
-    })
+        'last_id': messages_list[-1].pk if messages_list else after_id,
+    }
+    # Дані про співрозмовника та маршрут потрібні лише при першому завантаженні
+    if not after_id:
+        data.update({
+            'has_older': has_older,
+            'other_user': other_user.username,
+            'route_origin': route.origin_city if route else None,
+            'route_destination': route.destination_city if route else None,
+        })
+    return JsonResponse(data)
+
+
+# Нові повідомлення після курсора (водяний знак читача зсувається до останнього)
+async def _fetch_messages_after(conversation_id, user, after_id):
+    messages_list = [
+        msg async for msg in with_read_state(Message.objects.filter(conversation_id=conversation_id, pk__gt=after_id))
+        .select_related('sender')
+        .order_by('pk')
+    ]
+    if messages_list:
+        await sync_to_async(_mark_read)(user.pk, conversation_id, messages_list[-1].pk)
+    return [_message_data(msg) for msg in messages_list]
+
+
+async def _conversation_event_stream(conversation_id, user, last_id):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + SSE_STREAM_LIFETIME
+    yield f'retry: {SSE_RETRY_MS}\n\n'
+    async with get_broker().subscribe(conversation_channel(conversation_id)) as subscription:
+        # Підписка вже активна, тож догрузка пропущеного нічого не губить
+        pending = await _fetch_messages_after(conversation_id, user, last_id)
+        while True:
+            for data in pending:
+                if data['id'] > last_id:
+                    last_id = data['id']
+                    yield sse_event('message', data, event_id=last_id)
+            
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                # Завершуємо потік, браузер перепідключиться з Last-Event-ID
+                return
+            
+            payload = await subscription.get(min(SSE_HEARTBEAT_INTERVAL, remaining))
+            if payload is None:
+                # Тиша: heartbeat і звірка з базою (на випадок подій з іншого воркера)
+                yield ': heartbeat\n\n'
+                pending = await _fetch_messages_after(conversation_id, user, last_id)
+            else:
+                if payload['sender_id'] != user.pk:
+                    await sync_to_async(_mark_read)(user.pk, conversation_id, payload['id'])
+                    # Копія: LocalBroker віддає той самий словник усім підписникам каналу
+                    payload = {**payload, 'is_read': True}
+                pending = [payload]
+
+
+# Async-view: працює без блокування лише під ASGI-сервером (uvicorn/daphne)
+async def conversation_messages_stream(request, pk):
+    """SSE-потік нових повідомлень розмови"""
+    # Під WSGI потік буферизувався б цілком — 204 змушує EventSource перейти на опитування
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    
+    user = await sync_to_async(lambda: request.user if request.user.is_authenticated else None)()
+    if user is None:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    
+    try:
+        conversation = await Conversation.objects.aget(pk=pk)
+    except Conversation.DoesNotExist:
+        raise Http404
+    
+    # Перевірка доступу
+    if not conversation.has_participant(user):
+        return JsonResponse({'error': 'Access denied'}, status=403)
+    
+    # EventSource сам надсилає Last-Event-ID при перепідключенні
+    try:
+        last_id = int(request.headers.get('Last-Event-ID') or request.GET.get('after_id') or 0)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid after_id'}, status=400)
+    
+    return sse_response(_conversation_event_stream(conversation.pk, user, last_id))
 
 
 @login_required
-def route_messages_send(request, pk):
+@collect_notifications()
+def conversation_messages_send(request, pk):
     """API для відправки повідомлення (AJAX)"""
-    route = get_object_or_404(Route, pk=pk)
+    conversation = get_object_or_404(Conversation.objects.select_related('company', 'carrier'), pk=pk)
     
     # Перевірка доступу
-    if route.company != request.user and (not route.carrier or route.carrier != request.user):
+    if not conversation.has_participant(request.user):
         return JsonResponse({'error': 'Access denied'}, status=403)
     
     # Визначаємо співрозмовника
-    if request.user == route.company:
-        other_user = route.carrier
-    elif request.user == route.carrier:
-        other_user = route.company
-    else:
-        return JsonResponse({'error': 'Invalid user'}, status=403)
-    
-    if not route.carrier or not other_user:
-        return JsonResponse({'error': 'Invalid route'}, status=404)
+    other_user = conversation.other_participant(request.user)
     
     if request.method == 'POST':
         # Отримуємо контент з форми (application/x-www-form-urlencoded)
@@ -1002,119 +1156,199 @@ def route_messages_send(request, pk):
             content = request.POST.get('content', '').strip()
         
         if content:
-            message = Message.objects.create(
-                route=route,
-                sender=request.user,
-                recipient=other_user,
-                content=content
-            )
+            message = create_message(conversation, request.user, other_user, content)
+            _publish_message(message)
             
-            # Створюємо сповіщення
-            Notification.objects.create(
-                user=other_user,
-                notification_type='new_message',
-                title='Нове повідомлення',
-                message=f'Від {request.user.username}: {content[:50]}...',
-                route=route
-            )
+            # Сповіщення отримувача (згортається з непрочитаним по цій розмові)
+            notify_new_message(message)
             
             return JsonResponse({'success': True, 'message_id': message.id})
     
     return JsonResponse({'error': 'Invalid request'}, status=400)
 
 
+# Розмови, у яких бере участь користувач
+def _user_conversations(user):
+    if user.role == 'company':
+        conversations = Conversation.objects.filter(company=user)
+    elif user.role == 'carrier':
+        conversations = Conversation.objects.filter(carrier=user)
+    else:
+        conversations = Conversation.objects.none()
+    return conversations.select_related('company', 'carrier', 'route').order_by('-updated_at')
+
+
+# Скільки розмов показуємо на одній сторінці вхідних
+CHATS_PAGE_SIZE = 20
+
+
+# Вхідні одним запитом: лічильник і останнє повідомлення беремо з рядка учасника
+# (LEFT JOIN за унікальним індексом conversation+user замість підрахунку повідомлень)
+def _inbox_page(request):
+    user = request.user
+    conversations = (
+        _user_conversations(user)
+        .annotate(state=FilteredRelation('participants', condition=Q(participants__user=user)))
+        .annotate(
+            last_message_content=F('state__last_message__content'),
+            last_message_at=F('state__last_message__created_at'),
+            unread_count=Coalesce('state__unread_count', 0, output_field=PositiveIntegerField()),
+        )
+        # Остання активність: час останнього повідомлення або створення розмови
+        .annotate(last_activity=Coalesce('last_message_at', 'created_at'))
+        .order_by('-last_activity', '-pk')
+    )
+    page = Paginator(conversations, CHATS_PAGE_SIZE).get_page(request.GET.get('page'))
+    for conversation in page:
+        # company/carrier вже підтягнуті select_related, додаткових запитів немає
+        conversation.other_user = conversation.other_participant(user)
+    return page
+
+
 @login_required
 def chats_list(request):
     """Список всіх чатів користувача"""
-    # Отримуємо тільки маршрути-чати (де origin_city='Чат')
-    if request.user.role == 'company':
-        routes = Route.objects.filter(company=request.user, carrier__isnull=False, origin_city='Чат').order_by('-created_at')
-    elif request.user.role == 'carrier':
-        routes = Route.objects.filter(carrier=request.user, origin_city='Чат').order_by('-created_at')
-    else:
-        routes = Route.objects.none()
-    
-    # Для кожного маршруту отримуємо останнє повідомлення та кількість непрочитаних
-    chats_data = []
-    for route in routes:
-        other_user = route.carrier if request.user == route.company else route.company
-        
-        last_message = Message.objects.filter(route=route).order_by('-created_at').first()
-        unread_count = Message.objects.filter(route=route, recipient=request.user, is_read=False).count()
-        
-        chats_data.append({
-            'route': route,
-            'other_user': other_user,
-            'last_message': last_message,
-            'unread_count': unread_count,
-        })
-    
-    return render(request, 'logistics/chats_list.html', {'chats_data': chats_data})
+    return render(request, 'logistics/chats_list.html', {'page_obj': _inbox_page(request)})
+
+
+# Версія вхідних: нові розмови, повідомлення, зміни маршрутів та непрочитані
+def _chats_version(user):
+    """Return (version token, total unread messages) of the user's inbox"""
+    state = _user_conversations(user).aggregate(
+        conversations=Count('pk', distinct=True),
+        last_conversation=Max('pk'),
+        last_message=Max('participants__last_message_id'),
+        unread=Sum('participants__unread_count', filter=Q(participants__user=user)),
+        last_route_change=Max('route__updated_at'),
+    )
+    last_route_change = state['last_route_change']
+    unread = state['unread'] or 0
+    version = ':'.join(str(part) for part in (
+        state['conversations'], state['last_conversation'], state['last_message'], unread,
+        last_route_change.timestamp() if last_route_change else 0,
+    ))
+    return version, unread
+
+
+def _chats_etag(request):
+    return _version_etag(request, _chats_version(request.user)[0])
 
 
 @login_required
+@_conditional(_chats_etag)
 def chats_api(request):
     """API для отримання чатів (AJAX/HTMX)"""
-    # Отримуємо тільки маршрути-чати (де origin_city='Чат')
-    if request.user.role == 'company':
-        routes = Route.objects.filter(company=request.user, carrier__isnull=False, origin_city='Чат').order_by('-created_at')
-    elif request.user.role == 'carrier':
-        routes = Route.objects.filter(carrier=request.user, origin_city='Чат').order_by('-created_at')
-    else:
-        routes = Route.objects.none()
+    page = _inbox_page(request)
+    # Загальна кількість непрочитаних — один агрегат, а не сума по сторінці
+    total_unread = total_unread_messages(request.user)
     
     # Перевіряємо, чи це HTMX-запит
     is_htmx = request.headers.get('HX-Request') == 'true'
     
-    chats_data = []
-    total_unread = 0
-    for route in routes:
-        other_user = route.carrier if request.user == route.company else route.company
-        last_message = Message.objects.filter(route=route).order_by('-created_at').first()
-        unread_count = Message.objects.filter(route=route, recipient=request.user, is_read=False).count()
-        total_unread += unread_count
-        
-        chats_data.append({
-            'route_id': route.id,
-            'other_user': other_user.username,
-            'other_user_id': other_user.id,
-            'other_user_role': other_user.get_role_display(),
-            'route_origin': route.origin_city,
-            'route_destination': route.destination_city,
-            'route_status': route.get_status_display(),
-            'last_message': last_message.content[:50] if last_message else None,
-            'last_message_time': last_message.created_at.strftime('%d.%m.%Y %H:%M') if last_message else None,
-            'unread_count': unread_count,
-        })
-    
     if is_htmx:
         # Для HTMX повертаємо HTML-фрагмент
         html = render_to_string('logistics/chats_partial.html', {
-            'chats': chats_data,
+            'page_obj': page,
             'total_unread': total_unread,
         }, request=request)
         return HttpResponse(html)
     
     # Інакше повертаємо JSON для AJAX
+    return JsonResponse({'total_unread': total_unread, **_inbox_data(page)})
+
+
+# JSON-представлення сторінки вхідних (chats_api та розділ chats у sync_api)
+def _inbox_data(page):
+    chats_data = []
+    for conversation in page:
+        other_user = conversation.other_user
+        route = conversation.route
+        chats_data.append({
+            'conversation_id': conversation.id,
+            'route_id': route.id if route else None,
+            'other_user': other_user.username,
+            'other_user_id': other_user.id,
+            'other_user_role': other_user.get_role_display(),
+            'route_origin': route.origin_city if route else None,
+            'route_destination': route.destination_city if route else None,
+            'route_status': route.get_status_display() if route else None,
+            'last_message': conversation.last_message_content[:50] if conversation.last_message_content else None,
+            'last_message_time': conversation.last_message_at.strftime('%d.%m.%Y %H:%M') if conversation.last_message_at else None,
+            'unread_count': conversation.unread_count,
+        })
+    return {'chats': chats_data, 'page': page.number, 'has_next': page.has_next()}
+
+
+@login_required
+def cities_api(request):
+    """Автодоповнення міст відправлення за префіксом (AJAX)"""
+    try:
+        limit = int(request.GET.get('limit') or CITY_SUGGESTIONS_LIMIT)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid limit'}, status=400)
+    limit = max(1, min(limit, CITY_SUGGESTIONS_LIMIT))
+    
+    prefix = request.GET.get('q', '').strip()
+    suggestions = suggest_cities(prefix, limit) if prefix else []
+    return JsonResponse({
+        'cities': [{'city': city, 'routes': routes} for city, routes in suggestions],
+    })
+
+
+@login_required
+def messages_search_api(request):
+    """Повнотекстовий пошук по повідомленнях користувача (AJAX)"""
+    query = request.GET.get('q', '').strip()
+    try:
+        before_id = int(request.GET.get('before_id') or 0)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid before_id'}, status=400)
+    
+    results, has_more = search_messages(request.user, query, before_id)
+    
+    results_data = []
+    for message in results:
+        conversation = message.conversation
+        results_data.append({
+            'id': message.id,
+            'conversation_id': conversation.id,
+            'route_id': conversation.route_id,
+            'other_user': conversation.other_participant(request.user).username,
+            'sender': message.sender.username,
+            'snippet': message.snippet,
+            'created_at': message.created_at.strftime('%d.%m.%Y %H:%M'),
+        })
+    
     return JsonResponse({
-        'chats': chats_data,
-        'total_unread': total_unread,
+        'results': results_data,
+        'has_more': has_more,
+        # Курсор наступної сторінки — id найстарішого знайденого повідомлення
+        'next_before_id': results[-1].id if has_more else None,
     })
 
 
+# Маршрути для історії користувача
+def _history_routes(user):
+    if user.role == 'company':
+        return Route.objects.filter(company=user).order_by('-created_at')
+    if user.role == 'carrier':
+        return Route.objects.filter(carrier=user).order_by('-created_at')
+    return Route.objects.none()
+
+
+def _history_etag(request):
+    state = _history_routes(request.user).aggregate(routes=Count('pk'), last_change=Max('updated_at'))
+    last_change = state['last_change']
+    return _version_etag(request, state['routes'], last_change.timestamp() if last_change else 0)
+
+
 @login_required
+@_conditional(_history_etag)
 def history_api(request):
     """API для отримання історії маршрутів (AJAX)"""
     from django.template.loader import render_to_string
     
-    if request.user.role == 'company':
-        # Виключаємо тимчасові маршрути для чату
-        routes = Route.objects.filter(company=request.user).exclude(origin_city='Чат').exclude(destination_city='Чат').order_by('-created_at')
-    elif request.user.role == 'carrier':
-        # Виключаємо тимчасові маршрути для чату
-        routes = Route.objects.filter(carrier=request.user).exclude(origin_city='Чат').exclude(destination_city='Чат').order_by('-created_at')
-    else:
-        routes = Route.objects.none()
+    routes = _history_routes(request.user)
     
     html = render_to_string('dashboard/history_partial.html', {
         'routes': routes,
@@ -1126,7 +1360,7 @@ def history_api(request):
 
 @login_required
 def start_chat_with_user(request, user_id):
-    """Почати чат з користувачем (знайти або створити маршрут для чату)"""
+    """Почати чат з користувачем (знайти або створити розмову)"""
     from accounts.models import User
     
     other_user = get_object_or_404(User, pk=user_id)
@@ -1149,81 +1383,37 @@ def start_chat_with_user(request, user_id):
         company = other_user
         carrier = request.user
     
-    # Шукаємо існуючий маршрут між цими користувачами
-    existing_route = Route.objects.filter(
+    # Відкриваємо останню активну розмову між цими користувачами,
+    # а якщо її немає — створюємо прямий чат
+    conversation = Conversation.objects.filter(
         company=company,
         carrier=carrier
-    ).order_by('-created_at').first()
-    
-    if existing_route:
-        # Якщо є маршрут, перенаправляємо на його чат
-        if request.headers.get('HX-Request'):
-            # Для HTMX запитів відкриваємо модальне вікно
-            from django.template.loader import render_to_string
-            from django.http import HttpResponse
-            
-            # Отримуємо повідомлення
-            from logistics.models import Message
-            messages_list = Message.objects.filter(route=existing_route).order_by('created_at')
-            
-            # Визначаємо співрозмовника
-            if request.user == existing_route.company:
-                other_user_for_chat = existing_route.carrier
-            else:
-                other_user_for_chat = existing_route.company
-            
-            html = render_to_string('logistics/messages_modal.html', {
-                'route': existing_route,
-                'messages': messages_list,
-                'other_user': other_user_for_chat,
-                'user': request.user,
-            }, request=request)
-            return HttpResponse(html)
-        return redirect('route_messages', pk=existing_route.pk)
-    else:
-        # Створюємо тимчасовий маршрут для чату
-        from django.utils import timezone
-        from datetime import timedelta
-        
-        chat_route = Route.objects.create(
+    ).select_related('route').order_by('-updated_at').first()
+    created = conversation is None
+    if created:
+        conversation, created = Conversation.objects.get_or_create(
             company=company,
             carrier=carrier,
-            origin_city='Чат',
-            destination_city='Чат',
-            origin_country='UA',
-            destination_country='UA',
-            origin_lat=50.45,  # Київ
-            origin_lng=30.52,
-            destination_lat=50.45,
-            destination_lng=30.52,
-            cargo_type='Інше',
-            weight=0,
-            volume=0,
-            price=0,
-            pickup_date=timezone.now(),
-            delivery_date=timezone.now() + timedelta(days=1),
-            status='pending',
-            description='Тимчасовий маршрут для чату',
+            route=None
         )
+    
+    if request.headers.get('HX-Request'):
+        # Для HTMX запитів відкриваємо модальне вікно
+        messages_list, has_older = message_history(conversation)
         
-        if request.headers.get('HX-Request'):
-            # Для HTMX запитів відкриваємо модальне вікно
-            from django.template.loader import render_to_string
-            from django.http import HttpResponse
-            
-            from logistics.models import Message
-            messages_list = Message.objects.filter(route=chat_route).order_by('created_at')
-            
-            html = render_to_string('logistics/messages_modal.html', {
-                'route': chat_route,
-                'messages': messages_list,
-                'other_user': other_user,
-                'user': request.user,
-            }, request=request)
-            return HttpResponse(html)
-        
+        html = render_to_string('logistics/messages_modal.html', {
+            'conversation': conversation,
+            'route': conversation.route,
+            'messages': messages_list,
+            'has_older': has_older,
+            'other_user': other_user,
+            'user': request.user,
+        }, request=request)
+        return HttpResponse(html)
+    
+    if created:
         messages.info(request, f'Чат з {other_user.username} створено')
-        return redirect('route_messages', pk=chat_route.pk)
+    return redirect('conversation_messages', pk=conversation.pk)
 
 
 def user_profile(request, user_id):
@@ -1257,8 +1447,7 @@ def user_profile(request, user_id):
     
     # Статистика маршрутів
     if profile_user.role == 'company':
-        # Виключаємо тимчасові маршрути для чату
-        routes = Route.objects.filter(company=profile_user).exclude(origin_city='Чат').exclude(destination_city='Чат')
+        routes = Route.objects.filter(company=profile_user)
         routes_created = routes.count()
         routes_in_transit = routes.filter(status='in_transit').count()
         routes_completed = routes.filter(status='delivered').count()
@@ -1268,10 +1457,8 @@ def user_profile(request, user_id):
         ratings = None
         user_rating = None
     else:
-        # Виключаємо тимчасові маршрути для чату
-        routes = Route.objects.filter(carrier=profile_user).exclude(origin_city='Чат').exclude(destination_city='Чат')
-        # Виключаємо ставки на тимчасові маршрути для чату
-        bids = Bid.objects.filter(carrier=profile_user).exclude(route__origin_city='Чат').exclude(route__destination_city='Чат')
+        routes = Route.objects.filter(carrier=profile_user)
+        bids = Bid.objects.filter(carrier=profile_user)
         routes_created = 0
         routes_in_transit = routes.filter(status='in_transit').count()
         routes_completed = routes.filter(status='delivered').count()
@@ -1360,10 +1547,28 @@ def user_profile(request, user_id):
     return render(request, 'logistics/user_profile.html', context)
 
 
+# Версія сповіщень: кількість непрочитаних (з кешу) і час найновішого з них
+# (згорнуте new_message оновлює created_at, тож теж змінює версію)
+def _notifications_version(user):
+    """Return (version token, unread count) of the user's notifications"""
+    latest = Notification.objects.filter(user=user, is_read=False).aggregate(
+        latest=Max('created_at')
+    )['latest']
+    unread = unread_notifications_count(user.pk)
+    return f'{unread}:{latest.timestamp() if latest else 0}', unread
+
+
+def _notifications_etag(request):
+    return _version_etag(request, _notifications_version(request.user)[0])
+
+
 @login_required
+@_conditional(_notifications_etag)
 def notifications_api(request):
     """API для отримання сповіщень (AJAX/HTMX)"""
-    notifications = Notification.objects.filter(user=request.user, is_read=False).order_by('-created_at')[:10]
+    notifications = Notification.objects.filter(user=request.user, is_read=False).select_related('route').order_by('-created_at')[:10]
+    # Лічильник з кешу — без COUNT на кожне опитування
+    unread_count = unread_notifications_count(request.user.id)
     
     # Перевіряємо, чи це HTMX-запит
     is_htmx = request.headers.get('HX-Request') == 'true'
@@ -1372,21 +1577,12 @@ def notifications_api(request):
         # Для HTMX повертаємо HTML-фрагмент
         html = render_to_string('logistics/notifications_partial.html', {
             'notifications': notifications,
-            'unread_count': Notification.objects.filter(user=request.user, is_read=False).count(),
+            'unread_count': unread_count,
         }, request=request)
         return HttpResponse(html)
     
     # Інакше формуємо JSON для AJAX
-    notifications_data = [{
-        'id': n.id,
-        'type': n.notification_type,
-        'title': n.title,
-        'message': n.message,
-        'created_at': n.created_at.strftime('%d.%m.%Y %H:%M'),
-        'route_id': n.route.id if n.route else None,
-    } for n in notifications]
-    
-    unread_count = Notification.objects.filter(user=request.user, is_read=False).count()
+    notifications_data = [notification_data(n) for n in notifications]
     
     return JsonResponse({
         'notifications': notifications_data,
@@ -1394,12 +1590,112 @@ def notifications_api(request):
     })
 
 
+# Поточні лічильники: клієнт звіряє бейджі при кожному (пере)підключенні
+async def _unread_counters_event(user):
+    notifications_unread = await sync_to_async(unread_notifications_count)(user.pk)
+    messages_unread = await sync_to_async(total_unread_messages)(user)
+    return [sse_event('sync', {
+        'notifications_unread': notifications_unread,
+        'messages_unread': messages_unread,
+    })]
+
+
+# Особистий SSE-канал: нові сповіщення та зміни лічильників замість опитування кожні 30 секунд
+async def notifications_stream(request):
+    """SSE-потік сповіщень і лічильників непрочитаного"""
+    # Під WSGI потік буферизувався б цілком — 204 змушує EventSource перейти на опитування
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    
+    user = await sync_to_async(lambda: request.user if request.user.is_authenticated else None)()
+    if user is None:
+        return JsonResponse({'error': 'Authentication required'}, status=401)
+    
+    return sse_response(user_event_stream(user_channel(user.pk), lambda: _unread_counters_event(user)))
+
+
+@login_required
+def sync_api(request):
+    """Одне опитування замість окремих: сповіщення, вхідні та відкритий чат.
+
+    Клієнт передає версії розділів (notifications, chats), курсор чату
+    (conversation, after_id) та лічильник порожніх опитувань idle; у відповіді —
+    лише розділи, що змінилися, і рекомендована пауза next_poll (секунди).
+    """
+    data = {}
+    try:
+        idle = max(int(request.GET.get('idle') or 0), 0)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid idle'}, status=400)
+    
+    # Відкритий чат: нові повідомлення після курсора, як у conversation_messages_api.
+    # Обробляємо першим: позначка прочитання змінює версію вхідних
+    if request.GET.get('conversation'):
+        try:
+            conversation_id = int(request.GET['conversation'])
+            after_id = int(request.GET.get('after_id') or 0)
+        except ValueError:
+            return JsonResponse({'error': 'Invalid cursor'}, status=400)
+        conversation = Conversation.objects.filter(pk=conversation_id).first()
+        if conversation is None or not conversation.has_participant(request.user):
+            return JsonResponse({'error': 'Access denied'}, status=403)
+        messages_list = list(
+            with_read_state(Message.objects.filter(conversation=conversation, pk__gt=after_id))
+            .select_related('sender')
+            .order_by('pk')
+        )
+        if messages_list:
+            _mark_read(request.user.id, conversation.id, messages_list[-1].pk)
+        data['conversation'] = {
+            'id': conversation.id,
+            'messages': [_message_data(msg) for msg in messages_list],
+            'last_id': messages_list[-1].pk if messages_list else after_id,
+        }
+    
+    # Сповіщення: список повертаємо лише коли версія змінилася
+    if 'notifications' in request.GET:
+        version, unread = _notifications_version(request.user)
+        data['notifications'] = {'version': version}
+        if version != request.GET['notifications']:
+            notifications = (
+                Notification.objects.filter(user=request.user, is_read=False)
+                .select_related('route').order_by('-created_at')[:10]
+            )
+            data['notifications'].update({
+                'unread_count': unread,
+                'notifications': [notification_data(n) for n in notifications],
+            })
+    
+    # Вхідні: перша сторінка списку повертається лише коли версія змінилася
+    if 'chats' in request.GET:
+        version, unread = _chats_version(request.user)
+        data['chats'] = {'version': version, 'changed': version != request.GET['chats']}
+        if data['chats']['changed']:
+            data['chats'].update({'total_unread': unread, **_inbox_data(_inbox_page(request))})
+    
+    # Будь-яка зміна повертає частий ритм, порожні відповіді подвоюють паузу
+    changed = (
+        'notifications' in data.get('notifications', {})
+        or data.get('chats', {}).get('changed')
+        or data.get('conversation', {}).get('messages')
+    )
+    data['idle'] = 0 if changed else idle + 1
+    data['next_poll'] = next_poll_delay(data['idle'], chat_open='conversation' in data)
+    
+    return JsonResponse(data)
+
+
 @login_required
 def mark_notification_read(request, notification_id):
     """Позначити сповіщення як прочитане"""
-    notification = get_object_or_404(Notification, pk=notification_id, user=request.user)
-    notification.is_read = True
-    notification.save()
+    notifications = Notification.objects.filter(pk=notification_id, user=request.user)
+    # Умовний UPDATE: із двох одночасних кліків лічильник зменшує лише один,
+    # а згорнуте тим часом повідомлення (count, params) не перезаписується старими даними
+    if notifications.filter(is_read=False).update(is_read=True):
+        adjust_unread_notifications(request.user.id, -1)
+        publish_user_event(request.user.id, 'notification_read', unread_delta=-1)
+    elif not notifications.exists():
+        raise Http404
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return JsonResponse({'success': True})
@@ -1409,7 +1705,10 @@ def mark_notification_read(request, notification_id):
 @login_required
 def mark_all_notifications_read(request):
     """Позначити всі сповіщення як прочитані"""
-    Notification.objects.filter(user=request.user, is_read=False).update(is_read=True)
+    read_count = Notification.objects.filter(user=request.user, is_read=False).update(is_read=True)
+    if read_count:
+        invalidate_unread_notifications(request.user.id)
+        publish_user_event(request.user.id, 'notification_read', unread_delta=-read_count)
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return JsonResponse({'success': True})